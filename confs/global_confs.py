@@ -12,5 +12,92 @@ POLLING_SECONDS = 2
 IDLE_IMAGE_URL = 'https://play-lh.googleusercontent.com/cShys-AmJ93dB0SV8kE6Fl5eSaf4-qMMZdwEDKI5VEmKAXfzOqbiaeAsqqrEBCTdIEs'
 
 # Idle timeout (in seconds).
-# If nothing is playing for this amount of time, the Spotify loop will stop.
-IDLE_TIMEOUT = 5 * 60
\ No newline at end of file
+# If nothing is playing for this amount of time, the device hibernates:
+# frames are only sent as keepalive, and Spotify is polled less and less often.
+IDLE_TIMEOUT = 30
+
+# Interval (in seconds) to resend the last frame while hibernating, so WLED stays in live mode.
+# Set to 0 to send nothing at all while hibernating.
+HIBERNATE_KEEPALIVE_SECONDS = 2
+
+# Polling backs off exponentially while hibernating, up to this interval (in seconds).
+HIBERNATE_MAX_POLLING_SECONDS = 60
+
+# Number of ready frames that may wait for the ArtNet sender.
+# When the queue is full the oldest frame is dropped, so the latest frame always wins.
+FRAME_QUEUE_SIZE = 2
+
+# Render whole-image effects on a palette of the cover (up to 256 colors), instead of on every pixel.
+# Covers with more colors are quantized, so this trades exact colors for less work per frame.
+USE_PALETTE_FRAMES = False
+
+# Resolved addresses of targets are cached for this long (in seconds), then re-resolved in the background.
+RESOLVE_TTL = 5 * 60
+
+# Time to wait for ArtPollReply packets when discovering ArtNet nodes (in seconds).
+DISCOVERY_TIMEOUT = 1
+
+# Number of consecutive failed sends after which a target is re-resolved.
+RESOLVE_FAILURE_THRESHOLD = 3
+
+# Interval (in seconds) to save a warm-start snapshot of the displayed animation.
+# The snapshot is also saved on shutdown, and resumed on the next start.
+SNAPSHOT_INTERVAL = 30
+
+# The Spotify access token is refreshed in the background this long (in seconds) before it expires.
+TOKEN_REFRESH_MARGIN = 5 * 60
+
+# Budget of Spotify API calls per rolling window (in seconds), shared by every call of the process.
+# Spotify does not publish the exact limit, so keep it conservative.
+RATE_LIMIT_CALLS = 60
+RATE_LIMIT_WINDOW = 30
+
+# Record the ArtNet output of each device to confs/recording-<address>.bin, to be replayed with replay.py.
+RECORD_FRAMES = False
+
+# Record tracing spans of each stage (Spotify calls, covers, effects, rendering, sending), see utils/tracing.py.
+# Only the last TRACE_BUFFER_SIZE spans are kept, traces can be downloaded from /trace.
+TRACING = False
+TRACE_BUFFER_SIZE = 50_000
+
+# Image-scaling effect of playing covers: None, 'zoom', 'pan' or 'rotate' (see ScaleEffects).
+# Views are sampled from a cover SCALE_SOURCE_FACTOR times the resolution of the target,
+# blending neighbouring pixels with SCALE_BILINEAR (smoother, slightly more work per frame).
+SCALE_EFFECT = None
+SCALE_SOURCE_FACTOR = 4
+SCALE_BILINEAR = True
+
+# The event loop is watched for calls blocking it, which delay the frames of every device.
+# Any call blocking it for longer than LOOP_STALL_THRESHOLD (in seconds) is reported with its stack.
+LOOP_STALL_THRESHOLD = 0.1
+LOOP_LAG_INTERVAL = 0.05
+
+# Run the event loop on uvloop (pip install uvloop), if installed.
+USE_UVLOOP = True
+
+# Pulse whole-image brightness effects through the dimmer channel: the cover is sent once,
+# then each frame only updates the master brightness (first universe).
+# Requires the "Multi RGB + Dimmer" DMX mode on the WLED device (Settings > Sync Interfaces).
+USE_DIMMER_PULSE = False
+
+# With USE_DIMMER_PULSE, all pixels are sent again this often (in seconds), in case the device lost them.
+DIMMER_REFRESH_SECONDS = 1
+
+# Frames per second sent to each viewer of /preview by default (?fps= to change), and at most.
+PREVIEW_FPS = 15
+PREVIEW_MAX_FPS = 60
+
+# Output protocol of ARTNET devices: 'artnet', or 'e131' (sACN).
+# With E131_MULTICAST, each universe is sent once to its multicast group, however many devices listen to it.
+# Mirrored displays then only need to be set to E1.31 multicast with the same start universe in WLED
+# (Settings > Sync Interfaces), and do not need to be configured here.
+# With multicast, configured devices get consecutive universes from E131_START_UNIVERSE, unless given
+# a start_universe. When unicasting, they all start at E131_START_UNIVERSE.
+OUTPUT_PROTOCOL = 'artnet'
+E131_MULTICAST = True
+E131_START_UNIVERSE = 1
+E131_PRIORITY = 100
+
+# If not 0, receivers hold each frame until a synchronization packet on this universe,
+# so all universes and all devices update at once (the receivers must support E1.31 synchronization).
+E131_SYNC_UNIVERSE = 0
@@ -2,7 +2,15 @@ import asyncio
 from enum import Enum
 from math import ceil, floor
 
-from pyartnet import ArtNetNode, Channel, BaseUniverse, output_correction
+import numpy as np
+
+from confs.global_confs import TARGET_FPS, DIMMER_REFRESH_SECONDS, OUTPUT_PROTOCOL, E131_MULTICAST, \
+    E131_START_UNIVERSE, E131_PRIORITY, E131_SYNC_UNIVERSE
+from handlers.artnet.artnet_sender import ArtNetSender
+from handlers.artnet.e131_sender import E131Sender
+from handlers.artnet.recording import FrameRecorder
+from handlers.artnet.target_resolver import get_resolver
+from utils.clock import monotonic
 
 # ArtNet and WLED related constants
 CHANNELS_PER_UNIVERSE = 512
@@ -24,60 +32,138 @@ CHANNEL_WIDTH_MAPPING = {
 }
 
 
+def get_num_universes(leds: int, mode: WLEDArtNetMode) -> int:
+    """
+    :return: number of universes needed to send the given number of leds
+    """
+    leds_per_universe = floor(CHANNELS_PER_UNIVERSE / CHANNEL_WIDTH_MAPPING[mode])
+    return ceil(leds / leds_per_universe)
+
+
 class ArtNetHandler:
-    def __init__(self, target_address: str, port: int, leds: int, mode: WLEDArtNetMode):
+    def __init__(self,
+                 target_address: str,
+                 port: int,
+                 leds: int,
+                 mode: WLEDArtNetMode,
+                 permutation: np.ndarray = None,
+                 protocol: str = OUTPUT_PROTOCOL,
+                 start_universe: int = E131_START_UNIVERSE):
         """
         Initializes a handler for an ArtNet node.
 
-        # TODO: if mDNS is given, resolve to IP address first
-        # as otherwise it introduces significant lag to resolve the address first
+        Frames are handed over to a dedicated ArtNetSender, so setting pixels never waits on the network.
+        The target address is resolved in the background by a shared TargetResolver,
+        frames sent before it is resolved are dropped.
+        With the 'e131' protocol, frames are sent by an E131Sender instead (multicast if E131_MULTICAST,
+        in which case the target address is not resolved at all).
 
-        :param target_address: address of the ArtNet node
+        :param target_address: IP address, hostname or mDNS name of the ArtNet node
         :param port: port of the ArtNet node (standard port is 6454; not recommended to change)
         :param leds: number of leds in the ArtNet node
         :param mode: ArtNet mode of the WLED target
+        :param permutation: index of the source pixel of each led, in wiring order (see handlers.artnet.layout),
+            pixels are sent as given if None
+        :param protocol: 'artnet' or 'e131'
+        :param start_universe: E1.31 universe of the first universe of the node, for the 'e131' protocol
         """
-        self.node = ArtNetNode(target_address, port)
-        self.leds = leds
+        self.address = target_address
+        self.permutation = permutation
+        self.leds = leds if permutation is None else len(permutation)
         self.mode = mode
-        self.universes = self.__initialize_universes(mode)
-        self.__initialize_channels()
-
-    def __initialize_universes(self, mode: WLEDArtNetMode):
-        universes = []
+        self.universes = list(range(self.__get_num_universe(self.leds, mode)))
+        self.brightness = 255
+        self.pixel_data = bytes(self.leds * CHANNEL_WIDTH_MAPPING[self.mode])
+        self.last_pixels_time = 0.0
+        self.recorder: FrameRecorder | None = None
+
+        # multicast groups do not depend on the target, so it never needs resolving
+        multicast = protocol == 'e131' and E131_MULTICAST
+        self.resolver = None if multicast else get_resolver(target_address)
+        on_send_failure = self.resolver.report_failure if self.resolver is not None else None
+        on_send_success = self.resolver.report_success if self.resolver is not None else None
+
+        if protocol == 'e131':
+            self.sender = E131Sender(
+                None,
+                start_universe,
+                E131_MULTICAST,
+                E131_PRIORITY,
+                E131_SYNC_UNIVERSE,
+                on_send_failure=on_send_failure,
+                on_send_success=on_send_success
+            )
+        else:
+            self.sender = ArtNetSender(
+                None,
+                port,
+                on_send_failure=on_send_failure,
+                on_send_success=on_send_success
+            )
 
-        for i in range(self.__get_num_universe(self.leds, mode)):
-            universes.append(self.node.add_universe(i))
+        if self.resolver is not None:
+            self.resolver.subscribe(self.sender.set_address)
+            self.resolver.start()
+        self.sender.start()
 
-        # for u in universes:
-        #     u.set_output_correction(output_correction.quadratic)
+    def __get_num_universe(self, leds: int, mode: WLEDArtNetMode):
+        return get_num_universes(leds, mode)
 
-        return universes
+    def __get_led_per_universe(self):
+        return floor(CHANNELS_PER_UNIVERSE / CHANNEL_WIDTH_MAPPING[self.mode])
 
-    def __initialize_channels(self):
-        for idx, u in enumerate(self.universes):
-            channel_start = 1
+    def close(self):
+        """
+        Stops the sender of this handler, and the recording if any.
+        """
+        self.stop_recording()
+        if self.resolver is not None:
+            self.resolver.unsubscribe(self.sender.set_address)
+        self.sender.stop()
 
-            # for DIM_MULTI_RGB, add first channel for brightness
-            if self.mode is WLEDArtNetMode.DIM_MULTI_RGB and idx == 0:
-                u.add_channel(start=1, width=1, channel_name='brightness')
-                channel_start += 1
+    def start_recording(self, path: str):
+        """
+        Records every frame submitted from now on, see handlers.artnet.recording.
 
-            for i in range(self.__get_led_per_universe()):
-                u.add_channel(start=channel_start, width=CHANNEL_WIDTH_MAPPING[self.mode])
-                channel_start += CHANNEL_WIDTH_MAPPING[self.mode]
+        :param path: path of the recording file, an existing recording is replaced
+        """
+        self.stop_recording()
+        self.recorder = FrameRecorder(path)
+        print(f"Recording ArtNet output to {path}")
 
-    def __get_num_universe(self, leds: int, mode: WLEDArtNetMode):
-        leds_per_universe = floor(CHANNELS_PER_UNIVERSE / CHANNEL_WIDTH_MAPPING[mode])
-        total_universes = ceil(leds / leds_per_universe)
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.frames} frames to {self.recorder.path}")
+            self.recorder = None
 
-        return total_universes
+    def __submit(self, frame: dict[int, bytes]):
+        if self.recorder is not None:
+            self.recorder.record(frame)
 
-    def __get_led_per_universe(self):
-        return floor(CHANNELS_PER_UNIVERSE / CHANNEL_WIDTH_MAPPING[self.mode])
+        self.sender.submit(frame)
 
     def set_brightness(self, brightness: int):
-        self.universes[0]['brightness'].set_values([brightness])
+        """
+        Sets the master brightness of the node.
+
+        The pixels are still on the node, so only the first universe (holding the brightness channel)
+        is sent. All universes are sent again every DIMMER_REFRESH_SECONDS,
+        in case the node lost them (e.g. packet loss, or a reboot).
+
+        :param brightness: brightness value [0-255]
+        :return: None
+        """
+        if self.mode is not WLEDArtNetMode.DIM_MULTI_RGB:
+            raise Exception("Cannot set brightness for non-dimming mode!")
+
+        self.brightness = brightness
+
+        if monotonic() - self.last_pixels_time < DIMMER_REFRESH_SECONDS:
+            self.__submit(self.__assign_pixels(self.pixel_data, self.universes[:1]))
+        else:
+            self.last_pixels_time = monotonic()
+            self.__submit(self.__assign_pixels(self.pixel_data, self.universes))
 
     async def fade_brightness(self, brightness: int, fade_time: int):
         """
@@ -91,55 +177,99 @@ class ArtNetHandler:
         if self.mode is not WLEDArtNetMode.DIM_MULTI_RGB:
             raise Exception("Cannot fade brightness for non-dimming mode!")
 
-        self.universes[0]['brightness'].set_fade([brightness], fade_time)
+        start_brightness = self.brightness
+        steps = max(1, int(TARGET_FPS * fade_time / 1000))
+
+        for i in range(1, steps + 1):
+            self.set_brightness(round(start_brightness + (brightness - start_brightness) * i / steps))
+            await asyncio.sleep(fade_time / 1000 / steps)
+
+    @property
+    def sent_frames(self) -> int:
+        return self.sender.sent_frames
+
+    @property
+    def dropped_frames(self) -> int:
+        return self.sender.dropped_frames
+
+    async def set_pixels(self, pixels: np.ndarray | list, brightness: int = None):
+        """
+        Sends all pixels of the node.
+
+        :param pixels: (leds, 3) RGB values of the pixels
+        :param brightness: master brightness to send along [0-255], for DIM_MULTI_RGB mode only
+        :return: None
+        """
+        if brightness is not None:
+            if self.mode is not WLEDArtNetMode.DIM_MULTI_RGB:
+                raise Exception("Cannot set brightness for non-dimming mode!")
 
-        await self.universes[0]['brightness']
+            self.brightness = brightness
 
-    async def set_pixels(self, pixels: list):
-        assigned_pixels = self.__assign_pixels(pixels, self.universes)
+        pixels = np.asarray(pixels, dtype=np.uint8)
 
-        await asyncio.gather(*[self.__async_set_pixels(up) for up in assigned_pixels])
+        # a single gather maps the whole frame to the wiring order
+        if self.permutation is not None:
+            pixels = np.take(pixels, self.permutation, axis=0)
 
+        self.pixel_data = pixels.tobytes()
+        self.last_pixels_time = monotonic()
+        self.__submit(self.__assign_pixels(self.pixel_data, self.universes))
 
-    def __assign_pixels(self, pixels: list, universes: list):
+    def __assign_pixels(self, pixel_data: bytes, universes: list):
         """
-        Breaks up the given pixels, and assigns the maximum number into each universe.
+        Breaks up the given pixel data, and assigns the maximum number of pixels into each universe.
 
-        To be used for parallely setting pixels in universes.
-        :param pixels: list of all input pixels
+        :param pixel_data: channel data of all input pixels
         :param universes: list of universes in node
-        :return: tuple of (universe, pixels, channel_offset)
+        :return: dict of universe -> channel data
         """
-        # ppu: pixels-per-universe
-        ppu = self.__get_led_per_universe()
+        # cpu: pixel channels-per-universe
+        cpu = self.__get_led_per_universe() * CHANNEL_WIDTH_MAPPING[self.mode]
+
+        universe_to_data = {}
 
-        universe_to_pixels = []
+        for i in universes:
+            data = pixel_data[i * cpu:(i + 1) * cpu]
 
-        for i in range(len(universes)):
+            # for DIM_MULTI_RGB, first channel of the first universe is brightness
             if i == 0 and self.mode is WLEDArtNetMode.DIM_MULTI_RGB:
-                offset = 1
-            else:
-                offset = 0
+                data = bytes([self.brightness]) + data
 
-            pixel_slice = pixels[i * ppu:min((i + 1) * ppu, len(pixels))]
+            universe_to_data[i] = data
 
-            universe_to_pixels.append(
-                (universes[i], pixel_slice, offset)
-            )
+        return universe_to_data
 
-        return universe_to_pixels
 
-    async def __async_set_pixels(self, upo: tuple[BaseUniverse, list, int]):
+class ArtNetHandlerGroup:
+    def __init__(self, handlers: list[ArtNetHandler]):
         """
-        Asynchronously sets pixels in a given universe
+        Sends each frame to several ArtNet nodes, e.g. a wall of panels driven by several devices.
+        Each handler picks its own pixels of the frame with its permutation.
 
-        :param upo: a tuple of (universe, pixels to set, channel offset)
-            - channel_offset: offset of first pixel channel in universe
-        :return: None
+        :param handlers: handlers of the nodes
         """
-        universe, pixels, channel_offset = upo
-        latest_channel = 1 + channel_offset
+        self.handlers = handlers
+        self.mode = handlers[0].mode
+
+    def close(self):
+        for handler in self.handlers:
+            handler.close()
+
+    @property
+    def sent_frames(self) -> int:
+        return min(handler.sent_frames for handler in self.handlers)
+
+    @property
+    def dropped_frames(self) -> int:
+        return max(handler.dropped_frames for handler in self.handlers)
+
+    def set_brightness(self, brightness: int):
+        for handler in self.handlers:
+            handler.set_brightness(brightness)
+
+    async def set_pixels(self, pixels: np.ndarray | list, brightness: int = None):
+        pixels = np.asarray(pixels, dtype=np.uint8)
 
-        for p in pixels:
-            universe[f"{latest_channel}/{CHANNEL_WIDTH_MAPPING[self.mode]}"].set_values(p)
-            latest_channel += CHANNEL_WIDTH_MAPPING[self.mode]
+        for handler in self.handlers:
+            await handler.set_pixels(pixels, brightness)
@@ -0,0 +1,213 @@
+"""
+Dedicated sender stage for ArtNet output
+"""
+import socket
+import struct
+from collections import deque
+from threading import Thread, Condition
+from typing import Callable
+
+from confs.global_confs import FRAME_QUEUE_SIZE
+from utils.network_utils import BatchedDatagramSender
+from utils.tracing import span
+
+ARTNET_HEADER = b'Art-Net\x00'
+ARTNET_OPCODE_DMX = 0x5000
+ARTNET_PROTOCOL_VERSION = 14
+
+
+def build_artdmx_packet(universe: int, sequence: int, data: bytes) -> bytes:
+    """
+    Builds an ArtDmx packet.
+
+    refer: https://art-net.org.uk/ (Art-Net 4 specification, ArtDmx)
+
+    :param universe: 15-bit port address (Net, Sub-Net and Universe)
+    :param sequence: sequence number [1-255], 0 disables sequencing on the receiver
+    :param data: DMX channel data, up to 512 bytes
+    :return: the packet
+    """
+    # the port address is little-endian (SubUni, then Net), unlike the protocol version and length
+    # DMX data length must be even
+    if len(data) % 2:
+        data += b'\x00'
+
+    return ARTNET_HEADER \
+        + struct.pack('<H', ARTNET_OPCODE_DMX) \
+        + struct.pack('>HBB', ARTNET_PROTOCOL_VERSION, sequence, 0) \
+        + struct.pack('<H', universe) \
+        + struct.pack('>H', len(data)) \
+        + data
+
+
+class ArtNetSender:
+    def __init__(self,
+                 target_address: str | None,
+                 port: int,
+                 queue_size: int = FRAME_QUEUE_SIZE,
+                 on_send_failure: Callable[[], None] = None,
+                 on_send_success: Callable[[], None] = None):
+        """
+        Sends frames to an ArtNet node from a dedicated thread, on a long-lived socket.
+
+        Frames are submitted without blocking, and wait in a bounded queue.
+        If the queue is full, the oldest frame is dropped (latest frame wins),
+        so a slow send never stalls rendering, and rendering never waits on a send.
+        Frames may hold only some universes, the universes of a dropped frame are then
+        merged into the next frame, so no universe update is ever lost.
+
+        :param target_address: IP address of the ArtNet node, frames are dropped until it is known
+        :param port: port of the ArtNet node
+        :param queue_size: maximum number of frames waiting to be sent
+        :param on_send_failure: called from the sender thread when a frame could not be sent
+        :param on_send_success: called from the sender thread when a frame was sent
+        """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.port = port
+        self.datagram_sender = None
+        self.on_send_failure = on_send_failure
+        self.on_send_success = on_send_success
+        self.frames = deque(maxlen=queue_size)
+        self.condition = Condition()
+        self.running = False
+        self.thread = None
+        # whether a frame taken from the queue is being sent
+        self.sending = False
+
+        self.sequence = 0
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.failed_frames = 0
+
+        if target_address is not None:
+            self.set_address(target_address)
+
+    def set_address(self, target_address: str):
+        """
+        Changes the IP address frames are sent to. Can be called from any thread.
+
+        :param target_address: IP address of the ArtNet node
+        """
+        with self.condition:
+            self.datagram_sender = BatchedDatagramSender(self.socket, (target_address, self.port))
+
+    def start(self):
+        """
+        Starts the sender thread, if not yet running.
+        """
+        if self.running:
+            return
+
+        self.running = True
+        self.thread = Thread(target=self.__send_loop, name='ArtNetSender', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the sender thread and closes the socket. Frames still queued are discarded, see flush.
+        """
+        with self.condition:
+            self.running = False
+            self.frames.clear()
+            self.condition.notify_all()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.socket.close()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until every queued frame has been sent (or dropped, if the target is not known).
+
+        :param timeout: maximum time to wait (in seconds), None to wait until done
+        :return: True if the queue was drained, False on timeout
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.running or (not self.frames and not self.sending), timeout
+            )
+
+    def submit(self, frame: dict[int, bytes], block: bool = False):
+        """
+        Queues a frame to be sent. Never blocks, unless asked to.
+
+        :param frame: dict of universe -> DMX channel data
+        :param block: if True, waits for room in the queue instead of dropping the oldest frame
+        :return: None
+        """
+        with self.condition:
+            while block and self.running and len(self.frames) == self.frames.maxlen:
+                self.condition.wait()
+
+            if len(self.frames) == self.frames.maxlen:
+                self.dropped_frames += 1
+                dropped = self.frames.popleft()
+
+                # universes missing from the next frame keep the data of the dropped one
+                if self.frames:
+                    self.frames[0] = {**dropped, **self.frames[0]}
+                else:
+                    frame = {**dropped, **frame}
+
+            self.frames.append(frame)
+            self.condition.notify_all()
+
+    def _send_frame(self, datagram_sender: BatchedDatagramSender, frame: dict[int, bytes]):
+        """
+        Sends the packets of a frame, from the sender thread.
+
+        :param datagram_sender: sender to the current target
+        :param frame: dict of universe -> DMX channel data
+        """
+        sequence = self.__next_sequence()
+        datagram_sender.send([build_artdmx_packet(u, sequence, data) for u, data in frame.items()])
+
+    def __next_sequence(self):
+        # sequence numbers wrap around in [1-255], as 0 disables sequencing
+        self.sequence = self.sequence % 255 + 1
+        return self.sequence
+
+    def __send_loop(self):
+        while True:
+            with self.condition:
+                while self.running and not self.frames:
+                    self.condition.wait()
+
+                if not self.running:
+                    return
+
+                frame = self.frames.popleft()
+                datagram_sender = self.datagram_sender
+                self.sending = True
+                # wake up blocked submitters
+                self.condition.notify_all()
+
+            try:
+                self.__send(datagram_sender, frame)
+            finally:
+                with self.condition:
+                    self.sending = False
+                    # wake up flush
+                    self.condition.notify_all()
+
+    def __send(self, datagram_sender: BatchedDatagramSender | None, frame: dict[int, bytes]):
+        # target not resolved yet
+        if datagram_sender is None:
+            self.dropped_frames += 1
+            return
+
+        try:
+            with span("artnet.send", universes=len(frame)):
+                self._send_frame(datagram_sender, frame)
+            self.sent_frames += 1
+
+            if self.on_send_success is not None:
+                self.on_send_success()
+        except OSError as e:
+            self.failed_frames += 1
+            print(f"WARN - failed to send ArtNet frame: {e}")
+
+            if self.on_send_failure is not None:
+                self.on_send_failure()
@@ -0,0 +1,168 @@
+"""
+Sender stage for sACN (E1.31) output
+
+With multicast, each universe is sent once to its own multicast group, and every device listening
+to the universe receives it: mirrored displays cost no additional network load.
+"""
+import socket
+import struct
+import uuid
+from typing import Callable
+
+from confs.global_confs import FRAME_QUEUE_SIZE
+from handlers.artnet.artnet_sender import ArtNetSender
+from utils.network_utils import BatchedDatagramSender
+
+E131_PORT = 5568
+E131_SOURCE_NAME = b'SpotifyWLED'
+
+ACN_PACKET_IDENTIFIER = b'ASC-E1.17\x00\x00\x00'
+VECTOR_ROOT_E131_DATA = 0x00000004
+VECTOR_ROOT_E131_EXTENDED = 0x00000008
+VECTOR_E131_DATA_PACKET = 0x00000002
+VECTOR_E131_EXTENDED_SYNCHRONIZATION = 0x00000001
+VECTOR_DMP_SET_PROPERTY = 0x02
+
+_ROOT_LAYER = struct.Struct('>HH12sHI16s')
+_DATA_FRAMING_LAYER = struct.Struct('>HI64sBHBBH')
+_DMP_LAYER = struct.Struct('>HBBHHHB')
+_SYNC_FRAMING_LAYER = struct.Struct('>HIBHH')
+
+
+def _flags_and_length(length: int) -> int:
+    return 0x7000 | length
+
+
+def multicast_address(universe: int) -> str:
+    """
+    :param universe: E1.31 universe [1-63999]
+    :return: multicast group of the universe
+    """
+    return f"239.255.{universe >> 8}.{universe & 0xff}"
+
+
+def build_e131_packet(universe: int,
+                      sequence: int,
+                      data: bytes,
+                      cid: bytes,
+                      priority: int = 100,
+                      sync_universe: int = 0) -> bytes:
+    """
+    Builds an E1.31 data packet.
+
+    refer: ANSI E1.31-2018, section 4.1 (E1.31 Data Packet)
+
+    :param universe: E1.31 universe [1-63999]
+    :param sequence: sequence number [0-255] of the universe
+    :param data: DMX channel data, up to 512 bytes
+    :param cid: 16-byte UUID of the source
+    :param priority: priority of the source [0-200]
+    :param sync_universe: universe of the synchronization packets to wait for, 0 to display right away
+    :return: the packet
+    """
+    length = _ROOT_LAYER.size + _DATA_FRAMING_LAYER.size + _DMP_LAYER.size + len(data)
+
+    return _ROOT_LAYER.pack(0x0010, 0x0000, ACN_PACKET_IDENTIFIER,
+                            _flags_and_length(length - 16), VECTOR_ROOT_E131_DATA, cid) \
+        + _DATA_FRAMING_LAYER.pack(_flags_and_length(length - 38), VECTOR_E131_DATA_PACKET,
+                                   E131_SOURCE_NAME, priority, sync_universe, sequence, 0, universe) \
+        + _DMP_LAYER.pack(_flags_and_length(length - 115), VECTOR_DMP_SET_PROPERTY, 0xa1,
+                          0x0000, 0x0001, len(data) + 1, 0x00) \
+        + data
+
+
+def build_e131_sync_packet(sequence: int, sync_universe: int, cid: bytes) -> bytes:
+    """
+    Builds an E1.31 synchronization packet, displaying the data waiting for it on all receivers at once.
+
+    refer: ANSI E1.31-2018, section 4.2 (E1.31 Synchronization Packet)
+
+    :param sequence: sequence number [0-255] of the synchronization packets
+    :param sync_universe: universe of the synchronization packets
+    :param cid: 16-byte UUID of the source
+    :return: the packet
+    """
+    length = _ROOT_LAYER.size + _SYNC_FRAMING_LAYER.size
+
+    return _ROOT_LAYER.pack(0x0010, 0x0000, ACN_PACKET_IDENTIFIER,
+                            _flags_and_length(length - 16), VECTOR_ROOT_E131_EXTENDED, cid) \
+        + _SYNC_FRAMING_LAYER.pack(_flags_and_length(length - 38), VECTOR_E131_EXTENDED_SYNCHRONIZATION,
+                                   sequence, sync_universe, 0)
+
+
+class E131Sender(ArtNetSender):
+    def __init__(self,
+                 target_address: str | None,
+                 start_universe: int,
+                 multicast: bool = True,
+                 priority: int = 100,
+                 sync_universe: int = 0,
+                 queue_size: int = FRAME_QUEUE_SIZE,
+                 on_send_failure: Callable[[], None] = None,
+                 on_send_success: Callable[[], None] = None):
+        """
+        Sends frames as E1.31 from a dedicated thread, queued the same way as ArtNetSender.
+
+        Universe i of a frame is sent as E1.31 universe start_universe + i,
+        each with its own sequence numbers.
+
+        :param target_address: IP address of the receiver when unicasting, frames are dropped until it is known
+        :param start_universe: E1.31 universe of the first universe of frames
+        :param multicast: if True, each universe is sent to its multicast group instead of the target address
+        :param priority: priority of this source [0-200]
+        :param sync_universe: if not 0, receivers hold the data of each frame until a synchronization packet
+            is sent on this universe, so all universes (and all receivers) update at once
+        :param queue_size: maximum number of frames waiting to be sent
+        :param on_send_failure: called from the sender thread when a frame could not be sent
+        :param on_send_success: called from the sender thread when a frame was sent
+        """
+        super().__init__(None, E131_PORT, queue_size, on_send_failure, on_send_success)
+        self.start_universe = start_universe
+        self.multicast = multicast
+        self.priority = priority
+        self.sync_universe = sync_universe
+        self.cid = uuid.uuid4().bytes
+
+        self.universe_sequences: dict[int, int] = {}
+        self.sync_sequence = 0
+
+        if multicast:
+            # multicast stays on the local network
+            self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            self.datagram_sender = BatchedDatagramSender(self.socket, None)
+        elif target_address is not None:
+            self.set_address(target_address)
+
+    def set_address(self, target_address: str):
+        # multicast groups do not depend on the target
+        if not self.multicast:
+            super().set_address(target_address)
+
+    def _send_frame(self, datagram_sender: BatchedDatagramSender, frame: dict[int, bytes]):
+        datagrams = []
+
+        for i, data in frame.items():
+            universe = self.start_universe + i
+            # sequence numbers are kept per universe, and wrap around in [0-255]
+            sequence = self.universe_sequences.get(universe, -1) + 1 & 0xff
+            self.universe_sequences[universe] = sequence
+
+            datagrams.append((
+                build_e131_packet(universe, sequence, data, self.cid, self.priority, self.sync_universe),
+                self.__destination(universe, datagram_sender)
+            ))
+
+        if self.sync_universe:
+            self.sync_sequence = self.sync_sequence + 1 & 0xff
+            datagrams.append((
+                build_e131_sync_packet(self.sync_sequence, self.sync_universe, self.cid),
+                self.__destination(self.sync_universe, datagram_sender)
+            ))
+
+        datagram_sender.send_to(datagrams)
+
+    def __destination(self, universe: int, datagram_sender: BatchedDatagramSender) -> tuple[str, int]:
+        if self.multicast:
+            return multicast_address(universe), E131_PORT
+
+        return datagram_sender.address
@@ -0,0 +1,97 @@
+"""
+Physical layouts of LED matrices
+
+Frames are rendered row-major, as images are. Panels are often wired differently (serpentine, vertical,
+starting from another corner), and large walls are built from several panels, possibly driven
+by several devices. A layout is compiled once into a permutation per device: the index of the source
+pixel of each of its LEDs, in wiring order. Each frame is then mapped with a single gather per device.
+
+The wiring options follow WLED's 2D panel configuration.
+
+refer: https://kno.wled.ge/features/2D/
+"""
+import numpy as np
+
+
+class Panel:
+    def __init__(self,
+                 width: int,
+                 height: int,
+                 x: int = 0,
+                 y: int = 0,
+                 bottom_start: bool = False,
+                 right_start: bool = False,
+                 vertical: bool = False,
+                 serpentine: bool = False,
+                 address: str = None):
+        """
+        A panel of the wall, wired as one continuous chain of LEDs.
+
+        :param width: width of the panel
+        :param height: height of the panel
+        :param x: column of the top-left pixel of the panel in the wall
+        :param y: row of the top-left pixel of the panel in the wall
+        :param bottom_start: the first LED is at the bottom of the panel
+        :param right_start: the first LED is at the right of the panel
+        :param vertical: LEDs are chained by columns, instead of by rows
+        :param serpentine: every other row (or column) runs in the opposite direction
+        :param address: device driving the panel, the device of the wall if None.
+            Panels of the same device are chained in the order they are given.
+        """
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.bottom_start = bottom_start
+        self.right_start = right_start
+        self.vertical = vertical
+        self.serpentine = serpentine
+        self.address = address
+
+    def source_indices(self, wall_width: int) -> np.ndarray:
+        """
+        :param wall_width: width of the wall
+        :return: index of the source pixel in the wall of each LED of the panel, in wiring order
+        """
+        leds = np.arange(self.width * self.height)
+
+        # position along (major) and across (minor) the chain of LEDs
+        minor_length = self.height if self.vertical else self.width
+        major, minor = np.divmod(leds, minor_length)
+
+        if self.serpentine:
+            minor = np.where(major % 2 == 1, minor_length - 1 - minor, minor)
+
+        row, col = (minor, major) if self.vertical else (major, minor)
+
+        if self.bottom_start:
+            row = self.height - 1 - row
+        if self.right_start:
+            col = self.width - 1 - col
+
+        return (self.y + row) * wall_width + (self.x + col)
+
+
+def compile_layout(width: int, height: int, panels: list[Panel], address: str) -> dict[str, np.ndarray]:
+    """
+    Compiles the panels of a wall into one permutation per device.
+
+    :param width: width of the wall
+    :param height: height of the wall
+    :param panels: panels of the wall
+    :param address: device driving the panels without an address
+    :return: dict of device address -> index of the source pixel of each of its LEDs, in wiring order
+    """
+    device_indices: dict[str, list[np.ndarray]] = {}
+
+    for panel in panels:
+        if panel.x < 0 or panel.y < 0 or panel.x + panel.width > width or panel.y + panel.height > height:
+            raise ValueError(f"Panel at ({panel.x}, {panel.y}) of size {panel.width}x{panel.height} "
+                             f"does not fit in the {width}x{height} wall")
+
+        device_indices.setdefault(panel.address or address, []).append(panel.source_indices(width))
+
+    return {
+        device: np.concatenate(indices).astype(np.intp)
+        for device, indices in device_indices.items()
+    }
@@ -0,0 +1,185 @@
+"""
+Recording and replay of ArtNet output
+
+A recording is a single append-only binary file:
+    - magic and version
+    - one record per frame: timestamp (seconds since the first frame), number of universes, payload length
+    - the payload: for each universe, its number and the length of its DMX data, then the data
+
+Frames are only ever appended, so a recording cut short (e.g. by a crash) stays readable up to its last
+complete frame. Recordings are read from a memory-mapped file, without loading them into memory.
+"""
+import asyncio
+import mmap
+import re
+import struct
+from queue import SimpleQueue
+from threading import Thread
+from typing import Iterator
+
+from handlers.artnet.artnet_sender import ArtNetSender
+from utils.clock import monotonic
+from utils.common import format_path
+
+RECORDING_MAGIC = b'SWLEDREC'
+RECORDING_VERSION = 1
+
+_PREAMBLE = struct.Struct('<8sI')
+_FRAME_HEADER = struct.Struct('<dHI')
+_UNIVERSE_HEADER = struct.Struct('<HH')
+
+
+def get_recording_path(name: str) -> str:
+    """
+    :param name: name of the device the recording belongs to
+    :return: path of the recording file
+    """
+    return format_path(f"../confs/recording-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.bin")
+
+
+class FrameRecorder:
+    def __init__(self, path: str):
+        """
+        Records the frames sent to an ArtNet node, with their timestamps.
+
+        Frames are written from a dedicated thread, so recording never blocks rendering on the disk.
+
+        :param path: path of the recording file, an existing recording is replaced
+        """
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(_PREAMBLE.pack(RECORDING_MAGIC, RECORDING_VERSION))
+        self.start_time = None
+        self.frames = 0
+
+        # (timestamp, frame) to write, None once closed
+        self.queue: SimpleQueue[tuple[float, dict[int, bytes]] | None] = SimpleQueue()
+        self.thread = Thread(target=self.__write_loop, name='FrameRecorder', daemon=True)
+        self.thread.start()
+
+    def record(self, frame: dict[int, bytes]):
+        """
+        Appends a frame to the recording.
+
+        :param frame: dict of universe -> DMX channel data
+        """
+        now = monotonic()
+        if self.start_time is None:
+            self.start_time = now
+
+        self.queue.put((now - self.start_time, frame))
+        self.frames += 1
+
+    def close(self):
+        """
+        Writes the frames still queued, and closes the recording.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+
+    def __write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            timestamp, frame = item
+            payload = b''.join(_UNIVERSE_HEADER.pack(u, len(data)) + data for u, data in frame.items())
+            self.file.write(_FRAME_HEADER.pack(timestamp, len(frame), len(payload)) + payload)
+
+
+class FrameRecording:
+    def __init__(self, path: str):
+        """
+        Memory-maps a recording, and indexes its frames.
+
+        :param path: path of the recording file
+        """
+        with open(path, 'rb') as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = _PREAMBLE.unpack_from(self.mapped, 0)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError(f"Not a frame recording: {path}")
+
+        # (timestamp, universes, offset of the payload) of each complete frame
+        self.index: list[tuple[float, int, int]] = []
+
+        offset = _PREAMBLE.size
+        while offset + _FRAME_HEADER.size <= len(self.mapped):
+            timestamp, universes, length = _FRAME_HEADER.unpack_from(self.mapped, offset)
+            offset += _FRAME_HEADER.size
+
+            if offset + length > len(self.mapped):
+                break
+
+            self.index.append((timestamp, universes, offset))
+            offset += length
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: time between the first and the last frame (in seconds)
+        """
+        return self.index[-1][0] if self.index else 0.0
+
+    def frame(self, i: int) -> dict[int, bytes]:
+        """
+        :param i: index of the frame
+        :return: dict of universe -> DMX channel data
+        """
+        _, universes, offset = self.index[i]
+        frame = {}
+
+        for _ in range(universes):
+            universe, length = _UNIVERSE_HEADER.unpack_from(self.mapped, offset)
+            offset += _UNIVERSE_HEADER.size
+            frame[universe] = self.mapped[offset:offset + length]
+            offset += length
+
+        return frame
+
+    def __iter__(self) -> Iterator[tuple[float, dict[int, bytes]]]:
+        for i in range(len(self.index)):
+            yield self.index[i][0], self.frame(i)
+
+    def close(self):
+        self.mapped.close()
+
+
+async def replay(recording: FrameRecording, sender: ArtNetSender, speed: float | None = 1.0, loop: bool = False):
+    """
+    Streams a recording to an ArtNet sender.
+
+    :param recording: the recording to replay
+    :param sender: the sender to submit the frames to
+    :param speed: playback speed relative to the original timing,
+        or None to send frames as fast as the sender can, without dropping any
+    :param loop: if True, replays the recording until cancelled
+    :return: None
+    """
+    while True:
+        if speed is None:
+            await asyncio.to_thread(_submit_all, recording, sender)
+        else:
+            start_time = monotonic()
+
+            for timestamp, frame in recording:
+                # frames are paced against the original timeline, so delays do not accumulate
+                await asyncio.sleep(max(0.0, start_time + timestamp / speed - monotonic()))
+                sender.submit(frame)
+
+        if not loop:
+            return
+
+
+def _submit_all(recording: FrameRecording, sender: ArtNetSender):
+    for _, frame in recording:
+        if not sender.running:
+            return
+
+        sender.submit(frame, block=True)
@@ -0,0 +1,279 @@
+"""
+Resolution of ArtNet targets, by ArtPoll discovery or name lookup
+"""
+import asyncio
+import ipaddress
+import socket
+import struct
+from threading import Lock
+from typing import Callable
+
+from confs.global_confs import RESOLVE_TTL, DISCOVERY_TIMEOUT, RESOLVE_FAILURE_THRESHOLD
+from handlers.artnet.artnet_sender import ARTNET_HEADER, ARTNET_PROTOCOL_VERSION
+from utils.clock import monotonic
+
+ARTNET_PORT = 6454
+ARTNET_OPCODE_POLL = 0x2000
+ARTNET_OPCODE_POLL_REPLY = 0x2100
+
+
+class ArtNetNodeInfo:
+    def __init__(self, address: str, short_name: str, long_name: str):
+        """
+        An ArtNet node found by discovery.
+
+        :param address: IP address of the node
+        :param short_name: short name reported by the node
+        :param long_name: long name reported by the node
+        """
+        self.address = address
+        self.short_name = short_name
+        self.long_name = long_name
+
+    def matches(self, target: str) -> bool:
+        """
+        :param target: hostname or mDNS name of the target
+        :return: True if the node reports the given name
+        """
+        name = target.lower().removesuffix('.local')
+        return name in (self.short_name.lower(), self.long_name.lower())
+
+
+def build_artpoll_packet() -> bytes:
+    """
+    :return: an ArtPoll packet, asking all nodes to reply
+    """
+    return ARTNET_HEADER \
+        + struct.pack('<H', ARTNET_OPCODE_POLL) \
+        + struct.pack('>HBB', ARTNET_PROTOCOL_VERSION, 0, 0)
+
+
+def parse_artpoll_reply(data: bytes) -> ArtNetNodeInfo | None:
+    """
+    :param data: received packet
+    :return: ArtNetNodeInfo if the packet is an ArtPollReply, None otherwise
+    """
+    if len(data) < 108 or not data.startswith(ARTNET_HEADER) \
+            or struct.unpack_from('<H', data, 8)[0] != ARTNET_OPCODE_POLL_REPLY:
+        return None
+
+    def decode_name(raw: bytes):
+        return raw.split(b'\x00', 1)[0].decode('ascii', errors='ignore').strip()
+
+    return ArtNetNodeInfo(
+        socket.inet_ntoa(data[10:14]),
+        decode_name(data[26:44]),
+        decode_name(data[44:108])
+    )
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.nodes: dict[str, ArtNetNodeInfo] = {}
+
+    def datagram_received(self, data, addr):
+        node = parse_artpoll_reply(data)
+        if node is not None:
+            self.nodes[node.address] = node
+
+
+async def discover_nodes(timeout: float = DISCOVERY_TIMEOUT) -> list[ArtNetNodeInfo]:
+    """
+    Broadcasts an ArtPoll, and collects the ArtPollReply of every node that answers in time.
+
+    :param timeout: time to wait for replies (in seconds)
+    :return: list of nodes found
+    """
+    # nodes reply to the ArtNet port, so we have to listen on it
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind(('', ARTNET_PORT))
+
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(_DiscoveryProtocol, sock=sock)
+
+    try:
+        transport.sendto(build_artpoll_packet(), ('255.255.255.255', ARTNET_PORT))
+        await asyncio.sleep(timeout)
+    finally:
+        transport.close()
+
+    return list(protocol.nodes.values())
+
+
+class TargetResolver:
+    def __init__(self, target: str, ttl: float = RESOLVE_TTL):
+        """
+        Resolves the address of a target, and keeps it cached.
+
+        Resolution runs in the background: first by ArtPoll discovery, matching the name the
+        node reports, then by an asynchronous name lookup. The cached address is refreshed
+        when the TTL expires, or when sends to it keep failing, so the send path never
+        waits for a lookup.
+
+        :param target: IP address, hostname or mDNS name of the target
+        :param ttl: time to keep a resolved address (in seconds)
+        """
+        self.target = target
+        self.ttl = ttl
+        self.address: str | None = None
+        self.resolved_at = None
+
+        self.listeners: list[Callable[[str], None]] = []
+        self.failures = 0
+        self.lock = Lock()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.refresh_task: asyncio.Task | None = None
+        self.refresh_loop_task: asyncio.Task | None = None
+        # time to wait before retrying, while the target cannot be resolved
+        self.retry_delay = DISCOVERY_TIMEOUT
+        self.unresolved = False
+
+        # IP addresses never need resolving
+        try:
+            ipaddress.IPv4Address(target)
+            self.address = target
+            self.resolved_at = float('inf')
+        except ValueError:
+            pass
+
+    def start(self):
+        """
+        Starts resolving in the background, if needed. Must be called from the event loop.
+        """
+        if self.resolved_at == float('inf') or self.refresh_loop_task is not None:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.refresh_loop_task = self.loop.create_task(self.__refresh_loop())
+
+    def subscribe(self, listener: Callable[[str], None]):
+        """
+        Registers a function to be called with the new address, whenever it changes.
+
+        If already resolved, it is called right away with the current address.
+        """
+        self.listeners.append(listener)
+
+        if self.address is not None:
+            listener(self.address)
+
+    def unsubscribe(self, listener: Callable[[str], None]):
+        """
+        Unregisters a function registered with subscribe.
+
+        Background resolution stops with the last listener, until started again.
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+        if not self.listeners and self.refresh_loop_task is not None:
+            self.refresh_loop_task.cancel()
+            self.refresh_loop_task = None
+
+    def report_success(self):
+        self.failures = 0
+
+    def report_failure(self):
+        """
+        Reports a failed send to the target. Can be called from any thread.
+
+        After enough consecutive failures, the target is re-resolved in the background.
+        """
+        with self.lock:
+            self.failures += 1
+            should_refresh = self.failures >= RESOLVE_FAILURE_THRESHOLD
+
+        if should_refresh and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.__schedule_refresh)
+
+    async def resolve(self) -> str | None:
+        """
+        :return: the address of the target, resolving it first if not cached or expired
+        """
+        if self.address is None or monotonic() - self.resolved_at > self.ttl:
+            await self.refresh()
+
+        return self.address
+
+    async def refresh(self):
+        """
+        Resolves the target again, and notifies listeners if the address changed.
+
+        Refreshes are single-flight: concurrent calls wait for the one in progress,
+        so discovery never binds the ArtNet port twice.
+        """
+        await asyncio.shield(self.__schedule_refresh())
+
+    def __schedule_refresh(self) -> asyncio.Task:
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.get_running_loop().create_task(self.__refresh())
+
+        return self.refresh_task
+
+    async def __refresh(self):
+        address = await self.__discover() or await self.__lookup()
+
+        if address is None:
+            # only warn once, until the target is resolved again
+            if not self.unresolved:
+                print(f"WARN - could not resolve address for {self.target}, retrying in the background")
+            self.unresolved = True
+            self.retry_delay = min(self.retry_delay * 2, self.ttl)
+            return
+
+        self.resolved_at = monotonic()
+        self.failures = 0
+        self.retry_delay = DISCOVERY_TIMEOUT
+
+        if address != self.address or self.unresolved:
+            print(f"Resolved {self.target} to {address}")
+
+        self.unresolved = False
+
+        if address != self.address:
+            self.address = address
+
+            for listener in self.listeners:
+                listener(address)
+
+    async def __refresh_loop(self):
+        while True:
+            await self.resolve()
+            await asyncio.sleep(self.ttl if self.address is not None else self.retry_delay)
+
+    async def __discover(self):
+        try:
+            nodes = await discover_nodes()
+        except OSError as e:
+            print(f"WARN - ArtPoll discovery failed: {e}")
+            return None
+
+        for node in nodes:
+            if node.matches(self.target):
+                return node.address
+
+        return None
+
+    async def __lookup(self):
+        try:
+            info = await asyncio.get_running_loop().getaddrinfo(self.target, None, family=socket.AF_INET)
+        except socket.gaierror:
+            return None
+
+        return info[0][4][0] if info else None
+
+
+# resolvers are shared, so each target is only resolved once per process
+_resolvers: dict[str, TargetResolver] = {}
+
+
+def get_resolver(target: str) -> TargetResolver:
+    """
+    :param target: IP address, hostname or mDNS name of the target
+    :return: the shared TargetResolver of the target
+    """
+    if target not in _resolvers:
+        _resolvers[target] = TargetResolver(target)
+
+    return _resolvers[target]
@@ -2,15 +2,16 @@
 The HTTP server for the application
 """
 import asyncio
-from time import sleep
+import math
 
 from aiohttp import web
 
-from handlers.main_loops.ArtNetLoop import ArtNetLoop
-from handlers.spotify_api_handler import SpotifyAPIHandler
-from handlers.wled import WLEDArtNet, WLEDJson
-from utils.common import WLEDMode
-from utils.spotify_utils import calculate_remaining_time
+from confs.global_confs import PREVIEW_FPS
+from handlers.preview import get_preview, get_previews, PREVIEW_PAGE
+from handlers.spotify_session import SpotifySession, assign_universes
+from handlers.wled.wled_session import close_session
+from utils.loop_watchdog import LoopWatchdog
+from utils.tracing import export_trace, set_tracing, clear_trace, is_tracing
 
 
 # Spotify API has a rate limit per 30-second rolling window
@@ -20,100 +21,146 @@ from utils.spotify_utils import calculate_remaining_time
 #
 # https://developer.spotify.com/documentation/web-api/concepts/rate-limits
 
-# TODO: maybe add back JSON mode
-
-POLLING_SECONDS = 5  # period in seconds to poll Spotify API for changes
-
 
 class AioMainHTTPHandler():
-    def __init__(self,
-                 client_id: str,
-                 client_secret: str,
-                 wled_address: str,
-                 wled_mode: WLEDMode,
-                 width: int,
-                 height: int):
+    def __init__(self, sessions: list[SpotifySession]):
+        """
+        :param sessions: sessions (Spotify account -> devices) served by this process
+        """
         self.app = web.Application()
-        self.address = wled_address
-        self.api_handler = SpotifyAPIHandler(client_id, client_secret)
-        self.width = width
-        self.height = height
-        self.wled_mode = wled_mode
+        self.sessions = {session.name: session for session in sessions}
+
+        # fails right away if devices would share E1.31 universes
+        assign_universes(sessions)
+        self.watchdog = LoopWatchdog()
+
+    def __get_sessions(self, request) -> list[SpotifySession]:
+        """
+        :return: the session given by the "session" query parameter, or all sessions if not given
+        """
+        name = request.query.get("session")
 
-        self.animation_loop = None
+        if name is None:
+            return list(self.sessions.values())
 
-    async def __get_wled_handler(self, address: str, mode: WLEDMode):
-        task = asyncio.create_task(self.__actual_get(address, mode))
-        await task
-        return task.result()
+        if name not in self.sessions:
+            raise web.HTTPNotFound(text=f"Unknown session: {name}")
 
-    async def __actual_get(self, address, mode):
-        if mode == WLEDMode.ARTNET:
-            return WLEDArtNet(address, self.width, self.height, self.api_handler)
-        elif mode == WLEDMode.JSON:
-            return WLEDJson(address, self.width, self.height)
+        return [self.sessions[name]]
 
     async def __run_loop(self, request):
         """
-        runs the correct loop functions according to given WLED handler
+        runs the animation loops, if not already running
         """
-        # assign animation_loop
-        if self.wled_mode is WLEDMode.ARTNET:
-            self.animation_loop = ArtNetLoop(
-                WLEDArtNet(
-                    self.address,
-                    self.width,
-                    self.height,
-                    self.api_handler
-                )
-            )
+        started = await asyncio.gather(*[s.start() for s in self.__get_sessions(request)])
 
-        # run animation loop
-        self.animation_loop.run()
-
-        return web.Response(text="Started loop")
+        if any(any(s) for s in started):
+            return web.Response(text="Started loop")
+        else:
+            return web.Response(text="Loop already running")
 
     async def __stop_loop(self, request):
         """
-        stop running animation loop, if any
+        stop running animation loops, if any
+        """
+        stopped = await asyncio.gather(*[s.stop() for s in self.__get_sessions(request)])
+
+        return web.Response(text="Stopped loop" if any(any(s) for s in stopped) else "Loop not running")
+
+    async def __restart_loop(self, request):
+        """
+        stops the animation loops if running, and starts new ones
         """
-        self.animation_loop.stop()
+        await asyncio.gather(*[s.restart() for s in self.__get_sessions(request)])
 
-        return web.Response(text="Stopped loop")
+        return web.Response(text="Restarted loop")
 
-    async def __json_loop(self, wled_handler: WLEDJson):
+    async def __status(self, request):
+        """
+        returns the status of the animation loops and the current tracks
         """
-        TO BE REMOVED?
-        initiates listening loop to start updating WLED target with album cover
+        sessions = self.__get_sessions(request)
 
-        for JSON, polling is handled in this class
+        return web.json_response({
+            "running_loops": sum(s.running_loops() for s in sessions),
+            "sessions": [s.status() for s in sessions],
+            "event_loop": self.watchdog.status(),
+            "previews": [p.status() for p in get_previews()]
+        })
+
+    async def __preview(self, request):
         """
-        # when starting Spotify mode, turn on WLED regardless
-        wled_handler.on(True)
-        current_id = None
+        streams the frames sent to a device over WebSocket, or serves a page displaying them
 
-        while (True):
-            if not wled_handler.should_update():
-                break
-            image = self.api_handler.get_current_track_cover()
+        ?device=<address> selects the device (the first device by default), ?fps= throttles the frames
+        """
+        if not web.WebSocketResponse().can_prepare(request).ok:
+            return web.Response(text=PREVIEW_PAGE, content_type="text/html")
 
-            track = self.api_handler.get_current_track()
+        devices = [device.address for session in self.sessions.values() for device in session.devices]
 
-            if current_id is None or track.track_id != current_id:
-                wled_handler.update_cover(image)
+        # previews are only kept for configured devices
+        device = request.query.get("device", devices[0])
+        if device not in devices:
+            raise web.HTTPNotFound(text=f"Unknown device: {device}")
 
-            current_id = track.track_id
+        try:
+            fps = float(request.query.get("fps", PREVIEW_FPS))
+        except ValueError:
+            raise web.HTTPBadRequest(text="fps must be a number")
 
-            remaining_time = calculate_remaining_time(track) / 1000
+        if not math.isfinite(fps):
+            raise web.HTTPBadRequest(text="fps must be a finite number")
+
+        return await get_preview(device).serve(request, fps)
+
+    async def __trace(self, request):
+        """
+        returns the recorded tracing spans, as Chrome trace_event JSON
+
+        ?enable=1 / ?enable=0 turns tracing on/off, ?clear=1 discards the recorded spans
+        """
+        if "enable" in request.query:
+            set_tracing(request.query["enable"] == "1")
+
+        trace = export_trace()
+
+        if request.query.get("clear") == "1":
+            clear_trace()
+
+        trace["otherData"] = {"tracing": is_tracing()}
+        return web.json_response(trace)
+
+    async def __on_startup(self, app):
+        """
+        starts watching the event loop, resolving targets, and resumes warm-start snapshots
+        """
+        self.watchdog.start()
+
+        for session in self.sessions.values():
+            session.start_resolvers()
+            await session.resume_snapshots()
+
+    async def __on_shutdown(self, app):
+        """
+        saves warm-start snapshots of the running animations, then stops them
+        """
+        await asyncio.gather(*[s.shutdown() for s in self.sessions.values()])
 
-            if remaining_time < POLLING_SECONDS and track.is_playing:
-                sleep(remaining_time)
-            else:
-                sleep(POLLING_SECONDS)
+    async def __close_session(self, app):
+        await close_session()
+        await self.watchdog.stop()
 
     def run(self, host='0.0.0.0', port=8080):
+        self.app.on_startup.append(self.__on_startup)
+        self.app.on_shutdown.append(self.__on_shutdown)
+        self.app.on_cleanup.append(self.__close_session)
         self.app.add_routes([
             web.get('/start', self.__run_loop),
-            web.get('/stop', self.__stop_loop)
+            web.get('/stop', self.__stop_loop),
+            web.get('/restart', self.__restart_loop),
+            web.get('/status', self.__status),
+            web.get('/trace', self.__trace),
+            web.get('/preview', self.__preview)
         ])
         web.run_app(self.app, host=host, port=port)
@@ -1,14 +1,54 @@
+import asyncio
+
+from confs.global_confs import SNAPSHOT_INTERVAL, TARGET_FPS
 from handlers.wled import WLEDArtNet
 from utils.async_utils import ManagedCoroutineFunction
+from utils.clock import monotonic
+from utils.snapshot import SNAPSHOT_PATH
 
 
 class ArtNetLoop(ManagedCoroutineFunction):
-    def __init__(self, handler: WLEDArtNet):
+    def __init__(self, handler: WLEDArtNet, snapshot_path: str = SNAPSHOT_PATH):
         self.handler: WLEDArtNet = handler
+        self.snapshot_path = snapshot_path
+        self.last_snapshot_time = monotonic()
         super().__init__()
 
+        # poll right away when the device is turned back on
+        self.handler.device_state.add_listener(self.wake)
+
     async def _main_function(self):
         await self.handler.animate()
 
+    def status(self) -> dict:
+        engine = self.handler.engine
+        output = self.handler.handler
+
+        return {
+            "mode": "artnet",
+            "fps": TARGET_FPS,
+            "hibernating": engine.is_hibernating(),
+            "scene": type(engine.scene).__name__ if engine.scene is not None else None,
+            "sent_frames": output.sent_frames,
+            "dropped_frames": output.dropped_frames,
+            **engine.status()
+        }
+
+    def _stop_interval(self) -> float:
+        return self.handler.get_polling_seconds()
+
     async def _stop_function(self):
-        pass
+        try:
+            await self.handler.update()
+        except Exception as e:
+            # keep polling, Spotify or the network may just be failing for a moment
+            print(f"WARN - could not update {self.handler.address}: {e}")
+            return
+
+        if monotonic() - self.last_snapshot_time > SNAPSHOT_INTERVAL:
+            self.last_snapshot_time = monotonic()
+            await asyncio.to_thread(self.handler.save_snapshot, self.snapshot_path)
+
+    async def _cleanup_function(self):
+        self.handler.device_state.remove_listener(self.wake)
+        self.handler.close()
@@ -0,0 +1,52 @@
+import asyncio
+
+import aiohttp
+
+from confs.global_confs import POLLING_SECONDS
+from handlers.spotify_api_handler import SpotifyAPIHandler
+from handlers.wled import WLEDJson
+from utils.async_utils import ManagedCoroutineFunction
+from utils.spotify_utils import calculate_remaining_time
+
+
+class JSONLoop(ManagedCoroutineFunction):
+    def __init__(self, handler: WLEDJson, api_handler: SpotifyAPIHandler):
+        """
+        Low-FPS fallback, updating the cover through the WLED JSON API.
+        Only static covers are supported, it is updated whenever the track changes.
+        """
+        self.handler: WLEDJson = handler
+        self.api_handler: SpotifyAPIHandler = api_handler
+        self.current_id = None
+        super().__init__()
+
+    async def _main_function(self):
+        track = await asyncio.to_thread(self.api_handler.update_current_track)
+
+        if self.current_id is None or track.track_id != self.current_id:
+            await self.handler.update_cover(self.api_handler.get_current_track_cover())
+
+        self.current_id = track.track_id
+
+        # poll again right when the track ends, if that comes first
+        if track.is_playing:
+            await asyncio.sleep(min(POLLING_SECONDS, calculate_remaining_time(track) / 1000))
+        else:
+            await asyncio.sleep(POLLING_SECONDS)
+
+    def status(self) -> dict:
+        return {
+            "mode": "json",
+            "displaying_track": self.current_id
+        }
+
+    async def _stop_function(self):
+        try:
+            should_update = await self.handler.should_update()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # keep the loop running, the device may just be unreachable for a moment
+            print(f"WARN - could not get the state of {self.handler.base_url}: {e}")
+            return
+
+        if not should_update:
+            self.stop_event.set()
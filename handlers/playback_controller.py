@@ -0,0 +1,114 @@
+"""
+Controller for the animation loop of a device
+"""
+import asyncio
+from enum import Enum
+from typing import Callable
+
+from utils.async_utils import ManagedCoroutineFunction
+
+
+class ControllerState(Enum):
+    STOPPED = 0
+    STARTING = 1
+    RUNNING = 2
+    STOPPING = 3
+
+
+class PlaybackController:
+    def __init__(self, name: str, loop_factory: Callable[[], ManagedCoroutineFunction]):
+        """
+        Runs at most one animation loop for a device.
+
+        Start, stop and restart are single-flight: they are serialized by a lock, and starting
+        an already running controller does nothing, so repeated requests never stack loops.
+
+        :param name: name of the controlled device
+        :param loop_factory: function creating a new animation loop for the device
+        """
+        self.name = name
+        self.loop_factory = loop_factory
+        self.state = ControllerState.STOPPED
+        self.animation_loop: ManagedCoroutineFunction | None = None
+        self.task: asyncio.Task | None = None
+        self.lock = asyncio.Lock()
+
+    def is_running(self) -> bool:
+        return self.state is ControllerState.RUNNING and self.task is not None and not self.task.done()
+
+    async def start(self, loop_factory: Callable[[], ManagedCoroutineFunction] = None) -> bool:
+        """
+        Starts the animation loop, if not running yet.
+
+        :param loop_factory: function creating the loop, instead of the default one
+        :return: True if started, False if it was already running
+        """
+        async with self.lock:
+            return self.__start(loop_factory or self.loop_factory)
+
+    async def stop(self) -> bool:
+        """
+        Stops the animation loop, and waits until it has released its resources.
+
+        :return: True if stopped, False if it was not running
+        """
+        async with self.lock:
+            return await self.__stop()
+
+    async def restart(self):
+        """
+        Stops the animation loop if running, then starts a new one.
+        """
+        async with self.lock:
+            await self.__stop()
+            self.__start(self.loop_factory)
+
+    def status(self) -> dict:
+        """
+        :return: status of the controller and its loop
+        """
+        status = {
+            "device": self.name,
+            "state": (ControllerState.RUNNING if self.is_running() else
+                      ControllerState.STOPPED if self.state is ControllerState.RUNNING else
+                      self.state).name
+        }
+
+        if self.is_running() and hasattr(self.animation_loop, "status"):
+            status.update(self.animation_loop.status())
+
+        return status
+
+    def __start(self, loop_factory: Callable[[], ManagedCoroutineFunction]) -> bool:
+        if self.is_running():
+            return False
+
+        self.state = ControllerState.STARTING
+        try:
+            self.animation_loop = loop_factory()
+            self.task = self.animation_loop.run()
+        except Exception:
+            self.state = ControllerState.STOPPED
+            raise
+
+        self.state = ControllerState.RUNNING
+        return True
+
+    async def __stop(self) -> bool:
+        if self.task is None:
+            return False
+
+        was_running = self.is_running()
+
+        self.state = ControllerState.STOPPING
+        self.animation_loop.stop()
+
+        try:
+            await self.task
+        except Exception as e:
+            print(f"WARN - animation loop of {self.name} failed: {e}")
+
+        self.animation_loop = None
+        self.task = None
+        self.state = ControllerState.STOPPED
+        return was_running
@@ -0,0 +1,187 @@
+"""
+Live preview of the frames sent to devices, over WebSocket
+
+Each frame is broadcast as a binary message:
+    - width and height of the matrix (uint16, little-endian), master brightness (uint8)
+    - RGB values of the pixels, row by row (uint8)
+
+Every viewer has a single slot holding its latest frame, and its own sender task.
+A new frame replaces the one in the slot, so slow viewers skip frames instead of buffering them,
+and publishing a frame never waits on any viewer.
+"""
+import asyncio
+import struct
+
+import numpy as np
+from aiohttp import web, WSMsgType
+
+from confs.global_confs import PREVIEW_MAX_FPS
+from utils.clock import monotonic
+
+_HEADER = struct.Struct('<HHB')
+
+
+class PreviewViewer:
+    def __init__(self, ws: web.WebSocketResponse, fps: float):
+        """
+        :param ws: WebSocket of the viewer
+        :param fps: maximum frames per second sent to the viewer
+        """
+        self.ws = ws
+        self.interval = 1 / fps
+        self.frame: bytes | None = None
+        self.ready = asyncio.Event()
+        self.sent_frames = 0
+        self.skipped_frames = 0
+
+    def offer(self, frame: bytes):
+        if self.frame is not None:
+            self.skipped_frames += 1
+
+        self.frame = frame
+        self.ready.set()
+
+    async def send_loop(self):
+        next_send_time = monotonic()
+
+        while not self.ws.closed:
+            await self.ready.wait()
+            self.ready.clear()
+
+            # throttle, the frame in the slot keeps being replaced in the meantime
+            await asyncio.sleep(max(0.0, next_send_time - monotonic()))
+            next_send_time = max(next_send_time + self.interval, monotonic())
+
+            frame, self.frame = self.frame, None
+            if frame is None:
+                continue
+
+            try:
+                await self.ws.send_bytes(frame)
+                self.sent_frames += 1
+            except (ConnectionError, RuntimeError):
+                return
+
+
+class PreviewBroadcaster:
+    def __init__(self, name: str):
+        """
+        Broadcasts the frames of a device to its viewers.
+
+        :param name: name of the device
+        """
+        self.name = name
+        self.viewers: set[PreviewViewer] = set()
+
+    def publish(self, pixels: np.ndarray, width: int, height: int, brightness: int = 255):
+        """
+        Offers a frame to every viewer. Never blocks, and costs nothing without viewers.
+
+        :param pixels: (width * height, 3) uint8 array of the frame, row by row
+        :param width: width of the matrix
+        :param height: height of the matrix
+        :param brightness: master brightness the frame is displayed at
+        """
+        if not self.viewers:
+            return
+
+        frame = _HEADER.pack(width, height, brightness) + np.ascontiguousarray(pixels, dtype=np.uint8).tobytes()
+
+        for viewer in self.viewers:
+            viewer.offer(frame)
+
+    def status(self) -> dict:
+        return {
+            "device": self.name,
+            "viewers": len(self.viewers)
+        }
+
+    async def serve(self, request: web.Request, fps: float) -> web.WebSocketResponse:
+        """
+        Streams frames to a new viewer, until it disconnects.
+
+        :param request: WebSocket request of the viewer
+        :param fps: maximum frames per second sent to the viewer
+        """
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+
+        viewer = PreviewViewer(ws, min(max(fps, 1), PREVIEW_MAX_FPS))
+        self.viewers.add(viewer)
+        send_task = asyncio.create_task(viewer.send_loop())
+
+        try:
+            # viewers send nothing, this only waits for the connection to close
+            async for message in ws:
+                if message.type is WSMsgType.ERROR:
+                    break
+        finally:
+            self.viewers.discard(viewer)
+            send_task.cancel()
+            await asyncio.gather(send_task, return_exceptions=True)
+
+        return ws
+
+
+# broadcasters outlive animation loops, so viewers stay connected across restarts
+_broadcasters: dict[str, PreviewBroadcaster] = {}
+
+
+def get_preview(name: str) -> PreviewBroadcaster:
+    """
+    :param name: name of the device
+    :return: the shared PreviewBroadcaster of the device
+    """
+    if name not in _broadcasters:
+        _broadcasters[name] = PreviewBroadcaster(name)
+
+    return _broadcasters[name]
+
+
+def get_previews() -> list[PreviewBroadcaster]:
+    return list(_broadcasters.values())
+
+
+PREVIEW_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>SpotifyWLED preview</title>
+<style>
+body { background: #111; color: #888; font-family: sans-serif; margin: 0; }
+canvas { display: block; margin: 2em auto; image-rendering: pixelated; width: min(90vw, 90vh); }
+p { text-align: center; }
+</style>
+</head>
+<body>
+<canvas id="matrix"></canvas>
+<p id="status">connecting</p>
+<script>
+const canvas = document.getElementById("matrix");
+const status = document.getElementById("status");
+const context = canvas.getContext("2d");
+const ws = new WebSocket(location.href.replace(/^http/, "ws"));
+ws.binaryType = "arraybuffer";
+ws.onopen = () => status.textContent = "connected";
+ws.onclose = () => status.textContent = "disconnected";
+ws.onmessage = (event) => {
+    const view = new DataView(event.data);
+    const width = view.getUint16(0, true), height = view.getUint16(2, true), brightness = view.getUint8(4);
+    const rgb = new Uint8Array(event.data, 5);
+    if (canvas.width !== width || canvas.height !== height) {
+        canvas.width = width;
+        canvas.height = height;
+    }
+    const image = context.createImageData(width, height);
+    for (let i = 0, j = 0; i < rgb.length; i += 3, j += 4) {
+        image.data[j] = rgb[i] * brightness / 255;
+        image.data[j + 1] = rgb[i + 1] * brightness / 255;
+        image.data[j + 2] = rgb[i + 2] * brightness / 255;
+        image.data[j + 3] = 255;
+    }
+    context.putImageData(image, 0, 0);
+};
+</script>
+</body>
+</html>
+"""
@@ -1,16 +1,16 @@
 """
 Classes for interacting with Spotify API
 """
-import asyncio
-import inspect
-import pprint
-import time
 from functools import lru_cache
 
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
 
-from confs.global_confs import IDLE_IMAGE_URL, POLLING_SECONDS
+from confs.global_confs import IDLE_IMAGE_URL
+from handlers.spotify_rate_limiter import CallPriority, get_rate_budget
+from handlers.spotify_token_manager import SpotifyTokenManager
+from utils.clock import monotonic
+from utils.tracing import span
 
 
 class TrackObject:
@@ -30,6 +30,24 @@ class TrackObject:
             self.cover_url = None
             self.is_playing = False
 
+    def to_dict(self):
+        """
+        :return: the track, in the format of the Spotify API (None if not playing)
+        """
+        if self.track_id is None:
+            return None
+
+        return {
+            "item": {
+                "id": self.track_id,
+                "name": self.track_name,
+                "duration_ms": self.track_length,
+                "album": {"images": [{"url": self.cover_url}]}
+            },
+            "progress_ms": self.progress,
+            "is_playing": self.is_playing
+        }
+
 class AudioFeatures:
     def __init__(self, danceability: float, energy: float, key: int, loudness: float, mode: int,
                  speechiness: float, acousticness: float, instrumentalness: float,
@@ -59,6 +77,9 @@ class AudioFeatures:
 
         return all(value == 0.0 if isinstance(value, float) else value == 0 for value in attributes)
 
+    def to_dict(self):
+        return dict(vars(self))
+
     @classmethod
     def from_dict(cls, audio_features_dict: dict):
         return cls(
@@ -75,36 +96,62 @@ class AudioFeatures:
             audio_features_dict.get('tempo', 0.0))
 
 class SpotifyAPIHandler:
-    def __init__(self, client_id: str, client_secret: str):
-        self.spotify = spotipy.Spotify(auth_manager=SpotifyOAuth(
+    def __init__(self, client_id: str, client_secret: str, cache_path: str = None):
+        """
+        :param client_id: Spotify client ID of the app
+        :param client_secret: Spotify client secret of the app
+        :param cache_path: path of the token cache, each account needs its own (spotipy's default if None)
+        """
+        # the token is refreshed in the background, so no API call has to wait for it
+        self.token_manager = SpotifyTokenManager(SpotifyOAuth(
             client_id=client_id,
             client_secret=client_secret,
             redirect_uri="http://localhost:8080",
-            scope="user-read-currently-playing,user-read-playback-state"))
+            scope="user-read-currently-playing,user-read-playback-state",
+            cache_path=cache_path))
+        self.token_manager.start()
+        self.spotify = spotipy.Spotify(auth_manager=self.token_manager)
+
+        # every call goes through the budget shared by the app
+        self.rate_budget = get_rate_budget(client_id)
 
         self.current_track: TrackObject = TrackObject(None)
         self.audio_features: AudioFeatures = AudioFeatures.empty()
-        self.last_api_call_time = time.time()
-
-    def __handle_api_interval(self):
-        current_time = time.time()
-        diff = current_time - self.last_api_call_time
-        self.last_api_call_time = current_time
-        if diff < POLLING_SECONDS:
-            print(f"WARN - API call interval < {POLLING_SECONDS}s: {diff:.2f}; caller: {inspect.stack()[1].function}")
-        else:
-            print(f"API call interval: {diff:.2f}")
-
-    def update_current_track(self):
-        # Log API call interval in background
-        self.__handle_api_interval()
-        self.current_track = TrackObject(self.spotify.currently_playing())
+        # never polled yet, whatever the clock starts at
+        self.last_update_time = float('-inf')
+
+    def update_current_track(self, max_age: float = 0):
+        """
+        Polls the currently playing track.
+
+        :param max_age: if the track was polled less than this many seconds ago, that result is reused,
+            so all devices of an account share a single poll
+        :return: the current track
+        """
+        if monotonic() - self.last_update_time < max_age:
+            return self.current_track
+
+        # concurrent polls of the same account are merged into one call
+        with span("spotify.currently_playing"):
+            self.current_track = TrackObject(self.rate_budget.call(
+                ("currently_playing", id(self)),
+                CallPriority.PLAYBACK,
+                self.spotify.currently_playing
+            ))
+        self.last_update_time = monotonic()
         return self.current_track
 
     def get_current_track(self):
         return self.current_track
 
-    def get_audio_features(self):
+    def get_audio_features(self, track_id: str = None):
+        """
+        :param track_id: ID of the track, the current track if None
+        :return: audio features of the track
+        """
+        if track_id is not None:
+            return self._get_audio_features_cached(track_id)
+
         if self.current_track is None:
             self.update_current_track()
 
@@ -112,7 +159,13 @@ class SpotifyAPIHandler:
 
     @lru_cache(maxsize=32)
     def _get_audio_features_cached(self, track_id):
-        json = self.spotify.audio_features(track_id)
+        with span("spotify.audio_features", track_id=track_id):
+            json = self.rate_budget.call(
+                ("audio_features", track_id),
+                CallPriority.TRACK_DATA,
+                self.spotify.audio_features,
+                track_id
+            )
         self.audio_features = AudioFeatures.from_dict(json[0])
         return self.audio_features
 
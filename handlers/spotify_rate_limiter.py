@@ -0,0 +1,163 @@
+"""
+Shared rate-limit budget for Spotify API calls
+
+refer: https://developer.spotify.com/documentation/web-api/concepts/rate-limits
+"""
+import heapq
+import itertools
+from collections import deque
+from concurrent.futures import Future
+from enum import IntEnum
+from threading import Condition
+from typing import Callable, Hashable
+
+from spotipy.exceptions import SpotifyException
+
+from confs.global_confs import RATE_LIMIT_CALLS, RATE_LIMIT_WINDOW
+from utils.clock import monotonic, get_clock
+
+
+class CallPriority(IntEnum):
+    """
+    Priority of Spotify API calls, lower values go first.
+    """
+    PLAYBACK = 0
+    TRACK_DATA = 1
+    PREFETCH = 2
+
+
+# fraction of the budget each priority may use, so the rest stays available for more important calls
+PRIORITY_SHARE = {
+    CallPriority.PLAYBACK: 1.0,
+    CallPriority.TRACK_DATA: 0.8,
+    CallPriority.PREFETCH: 0.5
+}
+
+
+class SpotifyRateBudget:
+    def __init__(self, calls: int = RATE_LIMIT_CALLS, window: float = RATE_LIMIT_WINDOW):
+        """
+        Budget of API calls over a rolling window, modeled on Spotify's 30-second window.
+
+        Calls wait for a free slot by priority, and lower priorities can only use part of the budget.
+        Identical calls made while one is in flight are merged: they wait for and share its result.
+        When Spotify answers 429 anyway, all calls are held back for the given Retry-After.
+
+        Blocking and thread-safe, as spotipy calls are blocking.
+
+        :param calls: number of calls allowed per window
+        :param window: length of the rolling window (in seconds)
+        """
+        self.capacity = calls
+        self.window = window
+        self.call_times = deque()
+        self.blocked_until = 0.0
+
+        self.condition = Condition()
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.in_flight: dict[Hashable, Future] = {}
+
+        self.merged_calls = 0
+        self.throttled_calls = 0
+
+    def call(self, key: Hashable, priority: CallPriority, function: Callable, *args):
+        """
+        Makes an API call within the budget.
+
+        :param key: identifies the call, concurrent calls with the same key are merged
+        :param priority: priority of the call
+        :param function: function making the API call
+        :param args: arguments of the function
+        :return: result of the function
+        """
+        with self.condition:
+            future = self.in_flight.get(key)
+            is_owner = future is None
+
+            if is_owner:
+                future = Future()
+                self.in_flight[key] = future
+            else:
+                self.merged_calls += 1
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            self.__acquire(priority)
+            future.set_result(function(*args))
+        except SpotifyException as e:
+            if e.http_status == 429:
+                self.__hold_back(e)
+            future.set_exception(e)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.condition:
+                del self.in_flight[key]
+
+        return future.result()
+
+    def usage(self) -> int:
+        """
+        :return: number of calls made in the current window
+        """
+        with self.condition:
+            self.__prune(monotonic())
+            return len(self.call_times)
+
+    def __prune(self, now: float):
+        while self.call_times and now - self.call_times[0] >= self.window:
+            self.call_times.popleft()
+
+    def __acquire(self, priority: CallPriority):
+        with self.condition:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+            throttled = False
+
+            while True:
+                now = monotonic()
+                self.__prune(now)
+                limit = int(self.capacity * PRIORITY_SHARE[priority])
+
+                if self.waiting[0] == ticket and len(self.call_times) < limit and now >= self.blocked_until:
+                    heapq.heappop(self.waiting)
+                    self.call_times.append(now)
+                    # let the next caller in line check for a slot
+                    self.condition.notify_all()
+                    return
+
+                if not throttled and self.waiting[0] == ticket:
+                    throttled = True
+                    self.throttled_calls += 1
+                    print(f"WARN - Spotify API budget exhausted, delaying {priority.name} call")
+
+                # wait until the oldest call leaves the window, or the hold-back ends
+                timeout = max(self.blocked_until - now,
+                              self.call_times[0] + self.window - now if self.call_times else 0,
+                              0.01)
+                get_clock().wait(self.condition, timeout)
+
+    def __hold_back(self, e: SpotifyException):
+        retry_after = float((e.headers or {}).get("Retry-After", self.window))
+        print(f"WARN - Spotify API rate limit hit, holding back calls for {retry_after}s")
+
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, monotonic() + retry_after)
+
+
+# budgets are shared by client ID, as Spotify applies the rate limit per app
+_budgets: dict[str, SpotifyRateBudget] = {}
+
+
+def get_rate_budget(client_id: str) -> SpotifyRateBudget:
+    """
+    :param client_id: Spotify client ID of the app
+    :return: the shared SpotifyRateBudget of the app
+    """
+    if client_id not in _budgets:
+        _budgets[client_id] = SpotifyRateBudget()
+
+    return _budgets[client_id]
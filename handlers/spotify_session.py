@@ -0,0 +1,234 @@
+"""
+Sessions: one Spotify account, displayed on a set of devices
+"""
+import asyncio
+
+from confs.global_confs import E131_START_UNIVERSE, E131_MULTICAST, OUTPUT_PROTOCOL, USE_DIMMER_PULSE
+from handlers.artnet.artnet_handler import WLEDArtNetMode, get_num_universes
+from handlers.artnet.layout import Panel, compile_layout
+from handlers.artnet.target_resolver import get_resolver
+from handlers.main_loops.ArtNetLoop import ArtNetLoop
+from handlers.main_loops.JSONLoop import JSONLoop
+from handlers.playback_controller import PlaybackController
+from handlers.spotify_api_handler import SpotifyAPIHandler, TrackObject, AudioFeatures
+from handlers.wled import WLEDArtNet, WLEDJson
+from utils.common import WLEDMode
+from utils.snapshot import Snapshot, load_snapshot, discard_snapshot, get_snapshot_path
+
+
+class DeviceConfig:
+    def __init__(self,
+                 address: str,
+                 width: int,
+                 height: int,
+                 mode: WLEDMode = WLEDMode.ARTNET,
+                 panels: list[Panel] = None,
+                 start_universe: int = None):
+        """
+        Configuration of a WLED device.
+
+        :param address: IP address, hostname or mDNS name of the device
+        :param width: width of the matrix
+        :param height: height of the matrix
+        :param mode: protocol used to update the device
+        :param panels: physical layout of the matrix (ARTNET only), see handlers.artnet.layout.
+            Panels may be driven by other devices, the matrix is then displayed across all of them.
+        :param start_universe: first E1.31 universe of the matrix, when OUTPUT_PROTOCOL is 'e131'.
+            With multicast, devices displaying different content must use different universes:
+            if None, the device gets the universes following the previous device (see assign_universes).
+            When unicasting, it defaults to E131_START_UNIVERSE.
+        """
+        self.address = address
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.panels = panels
+        self.start_universe = start_universe
+
+    def addresses(self) -> list[str]:
+        """
+        :return: addresses of all devices driving the matrix
+        """
+        return list(dict.fromkeys([self.address] + [p.address for p in self.panels or [] if p.address]))
+
+    def num_universes(self) -> int:
+        """
+        :return: number of universes used by the matrix, across all its devices
+        """
+        mode = WLEDArtNetMode.DIM_MULTI_RGB if USE_DIMMER_PULSE else WLEDArtNetMode.MULTI_RGB
+
+        if self.panels is None:
+            return get_num_universes(self.width * self.height, mode)
+
+        layout = compile_layout(self.width, self.height, self.panels, self.address)
+        return sum(get_num_universes(len(permutation), mode) for permutation in layout.values())
+
+
+def assign_universes(sessions: list['SpotifySession']):
+    """
+    Gives each ARTNET device without a start universe its first universe.
+
+    With E1.31 multicast, each device gets the universes following the previous device,
+    so devices never share multicast groups by default. Otherwise every device is sent its own packets,
+    so they all start at E131_START_UNIVERSE.
+
+    :param sessions: all sessions of the process
+    :raise ValueError: with E1.31 multicast, if the universes of two devices overlap
+    """
+    multicast = OUTPUT_PROTOCOL == 'e131' and E131_MULTICAST
+    next_universe = E131_START_UNIVERSE
+    ranges: list[tuple[range, str]] = []
+
+    for session in sessions:
+        for device in session.devices:
+            if device.mode is not WLEDMode.ARTNET:
+                continue
+
+            if not multicast:
+                if device.start_universe is None:
+                    device.start_universe = E131_START_UNIVERSE
+                continue
+
+            if device.start_universe is None:
+                device.start_universe = next_universe
+
+            universes = range(device.start_universe, device.start_universe + device.num_universes())
+            next_universe = max(next_universe, universes.stop)
+
+            # multicast groups are per universe, so overlapping devices would fight on the receivers
+            for other, address in ranges:
+                if universes.start < other.stop and other.start < universes.stop:
+                    raise ValueError(f"E1.31 universes of {device.address} ({universes.start}-{universes.stop - 1}) "
+                                     f"overlap with {address} ({other.start}-{other.stop - 1})")
+
+            ranges.append((universes, device.address))
+
+
+class SpotifySession:
+    def __init__(self, name: str, client_id: str, client_secret: str, devices: list[DeviceConfig],
+                 default: bool = False):
+        """
+        Displays the playback of one Spotify account on a set of devices.
+
+        Each session has its own token cache and poll of the account, and one PlaybackController
+        per device. Everything else (covers, HTTP session, rate-limit budget) is shared with
+        the other sessions of the process.
+
+        :param name: name of the session, used for its token cache and snapshots
+        :param client_id: Spotify client ID of the app
+        :param client_secret: Spotify client secret of the app
+        :param devices: devices to display on
+        :param default: if True, uses spotipy's default token cache and the default snapshot,
+            like a single-account setup
+        """
+        self.name = name
+        self.devices = devices
+        self.default = default
+        self.api_handler = SpotifyAPIHandler(client_id, client_secret, None if default else f".cache-{name}")
+
+        self.controllers = [
+            PlaybackController(f"{name}/{device.address}", self.__loop_factory(device))
+            for device in devices
+        ]
+
+        # warm-start: restore the last known state, so it can be displayed before the first poll
+        self.snapshots: dict[str, Snapshot] = {}
+        for device in devices:
+            snapshot = load_snapshot(self.__snapshot_path(device))
+            if snapshot is not None and snapshot.size == (device.width, device.height) and snapshot.running:
+                self.snapshots[device.address] = snapshot
+
+        if self.snapshots:
+            snapshot = next(iter(self.snapshots.values()))
+            self.api_handler.current_track = TrackObject(snapshot.track)
+            self.api_handler.audio_features = AudioFeatures.from_dict(snapshot.audio_features)
+
+    def __snapshot_path(self, device: DeviceConfig):
+        # the first device of the default session keeps the snapshot of single-device setups
+        if self.default and device is self.devices[0]:
+            return get_snapshot_path()
+
+        return get_snapshot_path(f"{self.name}-{device.address}")
+
+    def __loop_factory(self, device: DeviceConfig, snapshot: Snapshot = None):
+        def create_loop():
+            if device.mode is WLEDMode.ARTNET:
+                wled_handler = WLEDArtNet(
+                    device.address, device.width, device.height, self.api_handler, device.panels, device.start_universe
+                )
+
+                if snapshot is not None:
+                    wled_handler.restore(snapshot)
+
+                return ArtNetLoop(wled_handler, self.__snapshot_path(device))
+            elif device.mode is WLEDMode.JSON:
+                return JSONLoop(WLEDJson(device.address, device.width, device.height), self.api_handler)
+
+        return create_loop
+
+    def start_resolvers(self):
+        """
+        Starts resolving the ArtNet targets in the background, so they are ready by the first start.
+        """
+        # multicast E1.31 is not sent to the targets
+        if OUTPUT_PROTOCOL == 'e131' and E131_MULTICAST:
+            return
+
+        for device in self.devices:
+            if device.mode is WLEDMode.ARTNET:
+                for address in device.addresses():
+                    get_resolver(address).start()
+
+    async def start(self) -> list[bool]:
+        return await asyncio.gather(*[c.start() for c in self.controllers])
+
+    async def stop(self) -> list[bool]:
+        stopped = await asyncio.gather(*[c.stop() for c in self.controllers])
+
+        # stopped on purpose, so it should not be resumed on the next start
+        for device in self.devices:
+            discard_snapshot(self.__snapshot_path(device))
+
+        return stopped
+
+    async def restart(self):
+        await asyncio.gather(*[c.restart() for c in self.controllers])
+
+    async def resume_snapshots(self):
+        """
+        Resumes the animations of the warm-start snapshots, if any.
+        """
+        for device, controller in zip(self.devices, self.controllers):
+            snapshot = self.snapshots.pop(device.address, None)
+
+            if snapshot is not None and device.mode is WLEDMode.ARTNET:
+                await controller.start(self.__loop_factory(device, snapshot))
+                print(f"[{self.name}] Resumed {device.address} from snapshot: "
+                      f"{self.api_handler.current_track.track_name}")
+
+    async def shutdown(self):
+        """
+        Saves warm-start snapshots of the running animations, then stops them.
+        """
+        for device, controller in zip(self.devices, self.controllers):
+            if controller.is_running() and isinstance(controller.animation_loop, ArtNetLoop):
+                controller.animation_loop.handler.save_snapshot(self.__snapshot_path(device))
+
+        await asyncio.gather(*[c.stop() for c in self.controllers])
+
+    def running_loops(self) -> int:
+        return sum(c.is_running() for c in self.controllers)
+
+    def status(self) -> dict:
+        track = self.api_handler.get_current_track()
+
+        return {
+            "session": self.name,
+            "running_loops": self.running_loops(),
+            "loops": [c.status() for c in self.controllers],
+            "track": {
+                "id": track.track_id,
+                "name": track.track_name,
+                "is_playing": track.is_playing
+            }
+        }
@@ -0,0 +1,86 @@
+"""
+Background refresh of the Spotify access token
+"""
+import time
+from threading import Thread, Condition
+
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
+
+from confs.global_confs import TOKEN_REFRESH_MARGIN
+
+# delay (in seconds) before retrying a failed refresh
+REFRESH_RETRY_SECONDS = 10
+
+
+class SpotifyTokenManager:
+    def __init__(self, oauth: SpotifyOAuth, refresh_margin: float = TOKEN_REFRESH_MARGIN):
+        """
+        Keeps a valid Spotify access token in memory, refreshing it in the background ahead of expiry.
+
+        Can be used as the auth_manager of any number of spotipy.Spotify clients: they all share
+        the same token, and no API call ever waits for a refresh.
+
+        :param oauth: SpotifyOAuth used to log in and refresh the token
+        :param refresh_margin: time before expiry to refresh the token (in seconds)
+        """
+        self.oauth = oauth
+        self.refresh_margin = refresh_margin
+        self.token_info: dict | None = None
+        self.condition = Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """
+        Gets the initial token (prompting to log in on the first run), and starts refreshing it.
+        """
+        if self.running:
+            return
+
+        token_info = self.oauth.get_cached_token()
+        if token_info is None:
+            self.oauth.get_access_token(as_dict=False)
+            token_info = self.oauth.get_cached_token()
+
+        self.token_info = token_info
+        self.running = True
+        self.thread = Thread(target=self.__refresh_loop, name='SpotifyTokenManager', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def get_access_token(self, as_dict: bool = False):
+        """
+        :param as_dict: if True, returns the whole token info instead of only the access token
+        :return: the current access token, from memory
+        """
+        if self.token_info is None:
+            self.start()
+
+        return self.token_info if as_dict else self.token_info["access_token"]
+
+    def __refresh_loop(self):
+        while True:
+            with self.condition:
+                delay = self.token_info["expires_at"] - self.refresh_margin - time.time()
+                if self.running and delay > 0:
+                    self.condition.wait(delay)
+
+                if not self.running:
+                    return
+
+                # woken up before it is time to refresh
+                if self.token_info["expires_at"] - self.refresh_margin > time.time():
+                    continue
+
+            try:
+                # the old token stays in use until the new one is ready
+                self.token_info = self.oauth.refresh_access_token(self.token_info["refresh_token"])
+                print(f"Refreshed Spotify access token, expires in "
+                      f"{self.token_info['expires_at'] - time.time():.0f}s")
+            except (SpotifyOauthError, OSError) as e:
+                print(f"WARN - failed to refresh Spotify access token, retrying: {e}")
+                time.sleep(REFRESH_RETRY_SECONDS)
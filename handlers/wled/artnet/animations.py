@@ -1,154 +1,505 @@
 import asyncio
-import time
-from threading import Thread
-from typing import final
-
-from confs.global_confs import TARGET_FPS, IDLE_TIMEOUT
-from handlers.artnet.artnet_handler import ArtNetHandler
-from handlers.spotify_api_handler import SpotifyAPIHandler, TrackObject
-from utils.async_utils import ManagedCoroutineFunction
-from utils.effects.base_effects import EffectData
+from functools import lru_cache
+
+import numpy as np
+
+from confs.global_confs import TARGET_FPS, USE_PALETTE_FRAMES, IDLE_TIMEOUT, HIBERNATE_KEEPALIVE_SECONDS, \
+    SCALE_EFFECT, SCALE_SOURCE_FACTOR, SCALE_BILINEAR
+from handlers.artnet.artnet_handler import ArtNetHandler, ArtNetHandlerGroup, WLEDArtNetMode
+from handlers.preview import PreviewBroadcaster
+from handlers.spotify_api_handler import SpotifyAPIHandler, TrackObject, AudioFeatures
+from handlers.wled.wled_state import WLEDStateSubscriber
+from utils.clock import monotonic
+from utils.effects.base_effects import EffectData, EffectStream, TransformData, ScaleEffects, prepare_source
 from utils.effects.effects import PlaybackEffects
-from utils.effects.effects_utils import is_black
-from utils.image_utils import get_cover
+from utils.effects.effects_utils import black_mask
+from utils.image_utils import get_cover, get_palette_cover, to_palette_image
+from utils.snapshot import Snapshot
+from utils.tracing import span
 
 """
 Animations for cover art.
 
-AnimateCover is the base class that implements the logic for sending the cover to WLED.
+AnimationEngine is the long-lived engine that sends the cover to WLED, one per device.
+It displays one CoverScene at a time, which can be swapped between frames.
 
-Each individual effect must implement the following:
+Each individual scene must implement the following:
      - _get_effect_data: to return the desired PlaybackEffect
-     - _stop_condition: should return True when the animation should stop
+and may implement:
+     - _get_transform_data: to return the desired ScaleEffect
+     - _get_audio_effect_data: to return the PlaybackEffect replacing the first one,
+       once the audio features of the track are fetched (in parallel with the cover)
 """
 
 
-class AnimateCover(ManagedCoroutineFunction):
+@lru_cache(maxsize=4)
+def get_scale_effect(width: int, height: int) -> TransformData:
+    """
+    Same as ScaleEffects.<SCALE_EFFECT>(), cached per matrix size,
+    so the sampling maps of the effect are computed once, not on every track change.
+
+    :param width: width of the target
+    :param height: height of the target
+    :return: TransformData of SCALE_EFFECT
+    """
+    source_size = (width * SCALE_SOURCE_FACTOR, height * SCALE_SOURCE_FACTOR)
+    scale_effects = ScaleEffects(width, height, *source_size, TARGET_FPS, SCALE_BILINEAR)
+    return getattr(scale_effects, SCALE_EFFECT)()
+
+
+class CoverScene:
+    # whether the scene has an effect depending on the audio features of the track
+    needs_audio_features = False
+
     def __init__(self,
                  width: int,
                  height: int,
-                 handler: ArtNetHandler,
                  api_handler: SpotifyAPIHandler,
                  track: TrackObject
                  ):
         """
-        Base class for all animations
+        Base class for all scenes.
+
+        A scene holds everything needed to render its frames, and is built once per (track, state).
 
-        :param handler: ArtNetHandler
-        :param image: image to animate
-        :param effect_data: the EffectData object with calculated effects
-        :param player_state: the player state associated with the animation
+        :param width: width of the target
+        :param height: height of the target
+        :param api_handler: SpotifyAPIHandler
+        :param track: the track associated with the scene
         """
-        self.handler: ArtNetHandler = handler
+        self.width = width
+        self.height = height
         self.api_handler: SpotifyAPIHandler = api_handler
-        self.image = get_cover(self.api_handler.get_current_track_cover(), (width, height))
-        self.effect_data = self._get_effect_data()
+        self.track = track
+
+        with span("scene.cover"):
+            self._set_image(
+                get_cover(self.api_handler.get_current_track_cover(), (width, height)),
+                get_palette_cover(self.api_handler.get_current_track_cover(), (width, height))
+                if USE_PALETTE_FRAMES else None
+            )
+
+        with span("scene.effect", scene=type(self).__name__):
+            self.effect_data = self._get_effect_data()
 
-        # track ID of cover art that is being played by current animation
+        with span("scene.transform", scene=type(self).__name__):
+            self.transform_data = self._get_transform_data()
+
+        # track ID of cover art that is being played by this scene
         self.displaying_tid = track.track_id
 
-        # currently active track on Spotify
-        self.current_track = track
+    def _set_image(self, image, palette_image):
+        self.image = image
+        self.black_pixels = black_mask(self.image)[:, np.newaxis]
+
+        # optional palette representation, effects are then applied to the palette only
+        self.palette_image = palette_image
+        if palette_image is not None:
+            self.black_palette = black_mask(self.palette_image.palette)[:, np.newaxis]
 
-        super().__init__()
+    def _get_effect_data(self) -> EffectData:
+        raise NotImplementedError
+
+    def _get_audio_effect_data(self, audio_features: AudioFeatures) -> EffectData:
+        raise NotImplementedError
 
-    @final
-    async def _main_function(self):
+    def set_audio_features(self, audio_features: AudioFeatures):
         """
-        Main function that plays animation
+        Replaces the effect of the scene with the one depending on the audio features of the track.
         """
-        for i in self.effect_data.factors:
-            # TODO: for brighter pixels, apply factor at 1.0 multiplier
-            # for darker pixels, apply factor scaled to absolute brightness
+        self.effect_data = self._get_audio_effect_data(audio_features)
 
-            # TODO: refactor into separate function
-            # TODO: WaveformEffects uses multiply every pixel, OverlayEffect should replace pixels
-            await self.handler.set_pixels([[int(r * i), int(g * i), int(b * i)]
-                                           if not is_black((r, g, b)) else
-                                           [int(r), int(g), int(b)]
-                                           for r, g, b in self.image])
-
-            # have to await according to target FPS
-            await asyncio.sleep(1 / TARGET_FPS)
+    def _get_transform_data(self) -> TransformData | None:
+        """
+        :return: image-scaling effect of the scene, sampling self.source_image, or None to display the cover as is
+        """
+        return None
 
-    @final
-    async def _stop_function(self):
-        Thread(target=self.__update_track).start()
-        if self._stop_condition():
-            self.stop_event.set()
 
-    @final
-    def __update_track(self):
-        self.current_track = self.api_handler.update_current_track()
+class PlayCover(CoverScene):
+    needs_audio_features = True
 
     def _get_effect_data(self) -> EffectData:
-        raise NotImplementedError
+        # displayed until the tempo of the track is known
+        return PlaybackEffects(self.width, self.height).steady()
 
-    def _stop_condition(self):
-        raise NotImplementedError
+    def _get_audio_effect_data(self, audio_features: AudioFeatures) -> EffectData:
+        # tracks without a detectable beat (e.g. spoken word) have a tempo of 0
+        if audio_features.tempo <= 0:
+            return PlaybackEffects(self.width, self.height).steady()
 
+        return PlaybackEffects(self.width, self.height).bpm_play(audio_features)
 
-class PlayCover(AnimateCover):
-    def __init__(self,
-                 width: int,
-                 height: int,
-                 handler: ArtNetHandler,
-                 api_handler: SpotifyAPIHandler,
-                 track: TrackObject
-                 ):
-        self.width = width
-        self.height = height
-        self.track = track
+    def _get_transform_data(self) -> TransformData | None:
+        if SCALE_EFFECT is None:
+            return None
 
-        super().__init__(width, height, handler, api_handler, track)
+        source_size = (self.width * SCALE_SOURCE_FACTOR, self.height * SCALE_SOURCE_FACTOR)
+        self.source_image = prepare_source(
+            get_cover(self.api_handler.get_current_track_cover(), source_size),
+            SCALE_BILINEAR
+        )
 
-    def _get_effect_data(self) -> EffectData:
-        return PlaybackEffects(self.width, self.height).bpm_play(self.api_handler.get_audio_features())
+        return get_scale_effect(self.width, self.height)
 
-    def _stop_condition(self):
-        return not self.current_track.is_playing \
-                or self.current_track.track_id != self.displaying_tid
 
-class PauseCover(AnimateCover):
-    def __init__(self,
-                 width: int,
-                 height: int,
-                 handler: ArtNetHandler,
-                 api_handler: SpotifyAPIHandler,
-                 track: TrackObject
-                 ):
-        self.width = width
-        self.height = height
-        self.track = track
+class PauseCover(CoverScene):
+    def _get_effect_data(self) -> EffectData:
+        return PlaybackEffects(self.width, self.height).pause()
 
-        super().__init__(width, height, handler, api_handler, track)
 
+class IdleCover(CoverScene):
     def _get_effect_data(self) -> EffectData:
         return PlaybackEffects(self.width, self.height).pause()
 
-    def _stop_condition(self):
-        return self.current_track.is_playing \
-                or self.current_track.track_id != self.displaying_tid
 
+class RestoredCover(CoverScene):
+    def __init__(self, snapshot: Snapshot, track: TrackObject):
+        """
+        Scene restored from a warm-start snapshot, displayed until the first live poll completes.
+
+        :param snapshot: the snapshot to restore
+        :param track: the track of the snapshot
+        """
+        self.width, self.height = snapshot.size
+        # the API is not needed, everything is restored from the snapshot
+        self.api_handler = None
+        self.track = track
+        self.scene_name = snapshot.scene
+        self._set_image(snapshot.cover, to_palette_image(snapshot.cover) if USE_PALETTE_FRAMES else None)
+        self.effect_data = EffectData.from_samples(snapshot.factors, snapshot.period)
+        self.transform_data = None
+        self.source_image = None
+        self.displaying_tid = track.track_id
 
-class IdleCover(AnimateCover):
+
+def get_scene_class(track: TrackObject) -> type[CoverScene]:
+    """
+    :param track: currently active track on Spotify
+    :return: the scene class that should be displayed for the given track
+    """
+    if track.track_id is None:
+        return IdleCover
+    elif track.is_playing:
+        return PlayCover
+    else:
+        return PauseCover
+
+
+class AnimationEngine:
     def __init__(self,
                  width: int,
                  height: int,
-                 handler: ArtNetHandler,
+                 handler: ArtNetHandler | ArtNetHandlerGroup,
                  api_handler: SpotifyAPIHandler,
-                 track: TrackObject
+                 device_state: WLEDStateSubscriber,
+                 preview: PreviewBroadcaster = None
                  ):
+        """
+        Persistent animation engine of a device.
+
+        The engine keeps rendering frames of the current scene, while scenes are swapped
+        atomically (a single attribute assignment) between frames.
+        Scenes are cached for the displayed track, so toggling play/pause does not rebuild anything.
+        In DIM_MULTI_RGB mode, whole-image brightness effects are pulsed through the dimmer channel:
+        the cover is sent once, then each frame only updates the master brightness.
+        No frames are sent while the device is turned off, and only keepalive frames
+        once the idle animation has played for IDLE_TIMEOUT (hibernation).
+
+        :param width: width of the target
+        :param height: height of the target
+        :param handler: ArtNetHandler, or ArtNetHandlerGroup for walls driven by several devices
+        :param api_handler: SpotifyAPIHandler
+        :param device_state: pushed state of the device
+        :param preview: broadcaster of the sent frames to /preview viewers, if any
+        """
         self.width = width
         self.height = height
-        self.track = track
-        self.idle_start_time = time.time()
+        self.handler: ArtNetHandler | ArtNetHandlerGroup = handler
+        self.api_handler: SpotifyAPIHandler = api_handler
+        self.device_state: WLEDStateSubscriber = device_state
+        self.preview = preview
 
-        super().__init__(width, height, handler, api_handler, track)
+        self.scene: CoverScene | None = None
+        self.effect_stream: EffectStream | None = None
+        self.next_frame_time = None
+        self.dimmer_pulse = handler.mode is WLEDArtNetMode.DIM_MULTI_RGB
 
-    def _get_effect_data(self) -> EffectData:
-        return PlaybackEffects(self.width, self.height).pause()
+        # hibernation state
+        self.idle_since = None
+        self.last_frame = None
+        self.last_frame_time = 0.0
+        self.wake_event = asyncio.Event()
+
+        # scenes built for the currently displayed track, by scene class
+        self.scenes: dict[type[CoverScene], CoverScene] = {}
+        self.audio_features_task: asyncio.Task | None = None
+
+        # track change -> first frame of the new track (and -> tempo effect applied) latencies (in seconds)
+        self.track_change_time = None
+        # scene of the new track, until its first frame is sent
+        self.first_frame_scene: CoverScene | None = None
+        self.first_frame_latency = None
+        self.audio_effect_latency = None
+
+    async def update(self, track: TrackObject, polled_at: float = None):
+        """
+        Swaps the current scene, if the track or its player state changed.
+
+        New scenes are built outside the event loop, so frames keep going out in the meantime.
+        The audio features of a new track are fetched in parallel with its cover: the new cover is
+        displayed as soon as it is ready, and its effect is replaced once the audio features arrive.
+
+        :param track: currently active track on Spotify
+        :param polled_at: time the poll that returned the track started, for the track change latency
+        :return: None
+        """
+        scene_class = get_scene_class(track)
+
+        if self.scene is not None \
+                and type(self.scene) is scene_class \
+                and self.scene.displaying_tid == track.track_id:
+            return
+
+        changed_at = None
+        if self.scene is None or self.scene.displaying_tid != track.track_id:
+            changed_at = polled_at if polled_at is not None else monotonic()
+
+        scene = self.scenes.get(scene_class)
+
+        if scene is None or scene.displaying_tid != track.track_id:
+            audio_features = None
+            if scene_class.needs_audio_features:
+                audio_features = asyncio.ensure_future(
+                    asyncio.to_thread(self.api_handler.get_audio_features, track.track_id)
+                )
+
+            try:
+                scene = await asyncio.to_thread(scene_class, self.width, self.height, self.api_handler, track)
+            except BaseException:
+                # nobody would wait for the audio features anymore
+                if audio_features is not None:
+                    audio_features.cancel()
+                raise
+
+            if any(s.displaying_tid != track.track_id for s in self.scenes.values()):
+                self.scenes.clear()
+
+            self.scenes[scene_class] = scene
+
+            if audio_features is not None:
+                self.audio_features_task = asyncio.create_task(self.__apply_audio_features(scene, audio_features))
+
+        self.__set_scene(scene, changed_at)
+
+    async def __apply_audio_features(self, scene: CoverScene, audio_features: asyncio.Future):
+        """
+        Replaces the effect of the scene once the audio features of its track arrive.
+        """
+        try:
+            scene.set_audio_features(await audio_features)
+        except Exception as e:
+            print(f"WARN - could not apply audio features, keeping the default effect: {e}")
+            return
+
+        if self.scene is scene:
+            self.effect_stream.swap(scene.effect_data)
+
+            if self.track_change_time is not None:
+                self.audio_effect_latency = monotonic() - self.track_change_time
+
+    def status(self) -> dict:
+        """
+        :return: latencies of the last track change (in ms)
+        """
+        return {
+            "first_frame_ms": round(self.first_frame_latency * 1000, 1)
+            if self.first_frame_latency is not None else None,
+            "audio_effect_ms": round(self.audio_effect_latency * 1000, 1)
+            if self.audio_effect_latency is not None else None
+        }
+
+    def restore(self, snapshot: Snapshot, track: TrackObject):
+        """
+        Displays the scene saved in a warm-start snapshot, until the next update.
+
+        :param snapshot: the snapshot to restore
+        :param track: the track of the snapshot
+        """
+        self.__set_scene(RestoredCover(snapshot, track))
+
+    def snapshot(self, audio_features: dict) -> Snapshot | None:
+        """
+        :param audio_features: audio features of the displayed track
+        :return: snapshot of the current scene, or None if nothing is displayed yet
+        """
+        scene = self.scene
+        if scene is None:
+            return None
+
+        scene_name = scene.scene_name if isinstance(scene, RestoredCover) else type(scene).__name__
+
+        return Snapshot(
+            (self.width, self.height),
+            scene.track.to_dict(),
+            audio_features,
+            scene_name,
+            scene.image,
+            np.array(scene.effect_data.sample(TARGET_FPS), dtype=np.float32),
+            scene.effect_data.period
+        )
+
+    def is_hibernating(self) -> bool:
+        """
+        :return: True if the device is off, or nothing has been playing for IDLE_TIMEOUT
+        """
+        if not self.device_state.is_on():
+            return True
+
+        return self.idle_since is not None and monotonic() - self.idle_since > IDLE_TIMEOUT
+
+    def __set_scene(self, scene: CoverScene, changed_at: float = None):
+        """
+        :param changed_at: time the track change was noticed, if the scene displays a new track
+        """
+        self.scene = scene
+
+        # the latency is measured up to the first frame of this very scene
+        if changed_at is not None:
+            self.track_change_time = changed_at
+            self.first_frame_scene = scene
+
+        if not isinstance(scene, IdleCover):
+            self.idle_since = None
+        elif self.idle_since is None:
+            self.idle_since = monotonic()
+
+        # leave hibernation right away, if a new scene has to be played
+        self.wake_event.set()
+
+        # the new effect continues from the phase of the previous one
+        if self.effect_stream is None:
+            self.effect_stream = EffectStream(scene.effect_data, monotonic())
+        else:
+            self.effect_stream.swap(scene.effect_data)
+
+    async def render_frame(self):
+        """
+        Renders and sends a single frame of the current scene, then waits for the next frame.
+        If the device is turned off, waits until it is turned on again instead.
+        """
+        if not self.device_state.is_on():
+            await self.device_state.wait_until_on()
+            # do not count the time spent off as lateness
+            self.next_frame_time = None
+            return
+
+        if self.is_hibernating():
+            await self.__hibernate()
+            return
+
+        render_start = monotonic()
+        scene = self.scene
+        i = self.effect_stream.factor_at(render_start)
+
+        # TODO: for brighter pixels, apply factor at 1.0 multiplier
+        # for darker pixels, apply factor scaled to absolute brightness
+
+        # TODO: WaveformEffects uses multiply every pixel, OverlayEffect should replace pixels
+        if self.dimmer_pulse and scene.transform_data is None:
+            await self.__pulse_dimmer(scene, i)
+        else:
+            with span("frame.modulate", factor=i):
+                if scene.transform_data is not None:
+                    self.last_frame = self.__apply_transform(scene, render_start, i)
+                else:
+                    self.last_frame = self.__apply_brightness(scene, i)
+
+            with span("frame.set_pixels"):
+                # the brightness is already applied to the pixels
+                await self.handler.set_pixels(self.last_frame, 255 if self.dimmer_pulse else None)
+
+            if self.preview is not None:
+                self.preview.publish(self.last_frame, self.width, self.height)
+
+        self.last_frame_time = render_start
+
+        if scene is self.first_frame_scene:
+            self.first_frame_scene = None
+            self.first_frame_latency = monotonic() - self.track_change_time
+
+        await self.__wait_next_frame()
+
+    async def __pulse_dimmer(self, scene: CoverScene, factor: float):
+        """
+        Applies the brightness factor through the dimmer channel.
+        The cover is only sent when it changes, otherwise only the brightness is.
+        """
+        brightness = min(255, max(0, round(255 * factor)))
+
+        with span("frame.set_brightness", brightness=brightness):
+            if self.last_frame is not scene.image:
+                self.last_frame = scene.image
+                await self.handler.set_pixels(scene.image, brightness)
+            else:
+                self.handler.set_brightness(brightness)
+
+        if self.preview is not None:
+            self.preview.publish(scene.image, self.width, self.height, brightness)
+
+    async def __hibernate(self):
+        """
+        Sends a keepalive frame if due, then waits until the next one, or until woken up.
+        """
+        self.wake_event.clear()
+
+        if HIBERNATE_KEEPALIVE_SECONDS > 0 \
+                and self.last_frame is not None \
+                and monotonic() - self.last_frame_time >= HIBERNATE_KEEPALIVE_SECONDS:
+            self.last_frame_time = monotonic()
+            await self.handler.set_pixels(self.last_frame)
+
+        try:
+            await asyncio.wait_for(self.wake_event.wait(), HIBERNATE_KEEPALIVE_SECONDS or None)
+        except asyncio.TimeoutError:
+            pass
+
+        # do not count the time spent hibernating as lateness
+        self.next_frame_time = None
+
+    def __apply_brightness(self, scene: CoverScene, factor: float):
+        """
+        Applies a brightness factor to the whole image of the scene, leaving black pixels as they are.
+
+        :return: (pixels, 3) uint8 array of the frame
+        """
+        if scene.palette_image is not None:
+            palette = scene.palette_image.palette
+            scaled = (palette * factor).astype(np.uint8)
+            return scene.palette_image.to_rgb_array(np.where(scene.black_palette, palette, scaled))
+
+        scaled = (scene.image * factor).astype(np.uint8)
+        return np.where(scene.black_pixels, scene.image, scaled)
+
+    def __apply_transform(self, scene: CoverScene, timestamp: float, factor: float):
+        """
+        Samples the view of the scene's image-scaling effect at the given time, then applies the brightness factor.
+        Views are functions of time, so they stay continuous when scenes with the same effect are swapped.
+
+        :return: (pixels, 3) uint8 array of the frame
+        """
+        image = scene.transform_data.map_at(timestamp).apply(scene.source_image)
+        scaled = (image * factor).astype(np.uint8)
+        return np.where(black_mask(image)[:, np.newaxis], image, scaled)
+
+    async def __wait_next_frame(self):
+        # frames are paced against a deadline, so the time taken to render does not accumulate
+        now = monotonic()
+        interval = 1 / TARGET_FPS
+
+        if self.next_frame_time is None or now - self.next_frame_time > interval:
+            # first frame, or fell behind by more than a frame: resynchronize
+            self.next_frame_time = now
 
-    def _stop_condition(self):
-        return time.time() - self.idle_start_time > IDLE_TIMEOUT \
-                or self.current_track.track_id is not None
+        self.next_frame_time += interval
+        await asyncio.sleep(max(0.0, self.next_frame_time - now))
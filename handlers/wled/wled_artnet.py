@@ -1,45 +1,124 @@
-from handlers.artnet.artnet_handler import ArtNetHandler, WLEDArtNetMode
-from handlers.spotify_api_handler import SpotifyAPIHandler
-from handlers.wled.artnet.animations import PlayCover, PauseCover, IdleCover
+import asyncio
+
+from confs.global_confs import POLLING_SECONDS, HIBERNATE_MAX_POLLING_SECONDS, RECORD_FRAMES, USE_DIMMER_PULSE, \
+    E131_START_UNIVERSE
+from handlers.artnet.artnet_handler import ArtNetHandler, ArtNetHandlerGroup, WLEDArtNetMode
+from handlers.artnet.layout import Panel, compile_layout
+from handlers.artnet.recording import get_recording_path
+from handlers.preview import get_preview
+from handlers.spotify_api_handler import SpotifyAPIHandler, TrackObject
+from handlers.wled.artnet.animations import AnimationEngine
 from handlers.wled.wled_handler import BaseWLEDHandler
+from utils.clock import monotonic
+from utils.snapshot import Snapshot, save_snapshot, SNAPSHOT_PATH
+from utils.tracing import span
 
 
 class WLEDArtNet(BaseWLEDHandler):
-    def __init__(self, address: str, width: int, height: int, spotify_handler: SpotifyAPIHandler):
+    def __init__(self,
+                 address: str,
+                 width: int,
+                 height: int,
+                 spotify_handler: SpotifyAPIHandler,
+                 panels: list[Panel] = None,
+                 start_universe: int = E131_START_UNIVERSE):
+        """
+        :param address: IP address, hostname or mDNS name of the device
+        :param width: width of the matrix
+        :param height: height of the matrix
+        :param spotify_handler: SpotifyAPIHandler
+        :param panels: physical layout of the matrix, see handlers.artnet.layout.
+            If None, pixels are sent row-major to the device.
+        :param start_universe: first E1.31 universe of the matrix, when sending E1.31.
+            Devices of a wall are given consecutive universes, in the order of their panels.
+        """
         super().__init__(address, width, height)
         self.api_handler = spotify_handler
         self.current_tid = self.api_handler.get_current_track().track_id
-        self.handler = ArtNetHandler(address, 6454, width * height, WLEDArtNetMode.MULTI_RGB)
-        self.animating_track = None
 
-    async def animate(self):
-        # update current track
-        current_track = self.api_handler.update_current_track()
-
-        # idle animation, if no track is playing
-        if current_track.track_id is None:
-            await IdleCover(
-                self.size[0],
-                self.size[1],
-                self.handler,
-                self.api_handler,
-                current_track
-            ).run()
-
-        # run appropriate animation (play/pause)
-        if current_track.is_playing:
-            await PlayCover(
-                self.size[0],
-                self.size[1],
-                self.handler,
-                self.api_handler,
-                current_track
-            ).run()
+        mode = WLEDArtNetMode.DIM_MULTI_RGB if USE_DIMMER_PULSE else WLEDArtNetMode.MULTI_RGB
+
+        if panels is None:
+            handlers = [ArtNetHandler(address, 6454, width * height, mode, start_universe=start_universe)]
+        else:
+            handlers = []
+            for device, permutation in compile_layout(width, height, panels, address).items():
+                handlers.append(ArtNetHandler(
+                    device, 6454, len(permutation), mode, permutation, start_universe=start_universe
+                ))
+                start_universe += len(handlers[-1].universes)
+
+        if RECORD_FRAMES:
+            for handler in handlers:
+                handler.start_recording(get_recording_path(handler.address))
+
+        self.handler = handlers[0] if len(handlers) == 1 else ArtNetHandlerGroup(handlers)
+        self.engine = AnimationEngine(
+            width, height, self.handler, self.api_handler, self.device_state, get_preview(address)
+        )
+        self.update_lock = asyncio.Lock()
+        self.polling_seconds = POLLING_SECONDS
+
+    def close(self):
+        """
+        Releases the ArtNet output of this device.
+        """
+        self.handler.close()
+
+    def get_polling_seconds(self) -> float:
+        """
+        :return: time to wait until the next poll, backing off exponentially while hibernating
+        """
+        if self.engine.is_hibernating():
+            self.polling_seconds = min(self.polling_seconds * 2, HIBERNATE_MAX_POLLING_SECONDS)
         else:
-            await PauseCover(
-                self.size[0],
-                self.size[1],
-                self.handler,
-                self.api_handler,
-                current_track
-            ).run()
+            self.polling_seconds = POLLING_SECONDS
+
+        return self.polling_seconds
+
+    async def update(self):
+        """
+        Polls the currently playing track, and updates the animation accordingly.
+        """
+        async with self.update_lock:
+            with span("update", device=self.address):
+                polled_at = monotonic()
+                # other devices of the same account may have just polled
+                current_track = await asyncio.to_thread(self.api_handler.update_current_track, POLLING_SECONDS / 2)
+                self.current_tid = current_track.track_id
+
+                await self.engine.update(current_track, polled_at)
+
+    def restore(self, snapshot: Snapshot):
+        """
+        Resumes the animation saved in a warm-start snapshot, and polls the live state in the background.
+
+        :param snapshot: the snapshot to restore
+        """
+        self.engine.restore(snapshot, TrackObject(snapshot.track))
+        asyncio.get_running_loop().create_task(self.update())
+
+    def save_snapshot(self, path: str = SNAPSHOT_PATH):
+        """
+        Saves a warm-start snapshot of the current animation, if any.
+
+        :param path: path of the snapshot file
+        """
+        snapshot = self.engine.snapshot(self.api_handler.audio_features.to_dict())
+
+        if snapshot is None:
+            return
+
+        try:
+            save_snapshot(snapshot, path)
+        except OSError as e:
+            print(f"WARN - could not save snapshot: {e}")
+
+    async def animate(self):
+        """
+        Sends the next frame of the animation.
+        """
+        if self.engine.scene is None:
+            await self.update()
+
+        await self.engine.render_frame()
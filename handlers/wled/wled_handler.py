@@ -2,9 +2,9 @@
 Class to interact with WLED server
 """
 import asyncio
-from enum import Enum
 
-import requests
+from handlers.wled.wled_session import get_session
+from handlers.wled.wled_state import get_state_subscriber
 
 WLED_JSON_UPDATE_PATH = "/json/state"
 
@@ -17,31 +17,40 @@ class BaseWLEDHandler():
     """
     def __init__(self, address: str, width: int, height: int):
         self.address = address
+        self.base_url = address if address.startswith("http") else f"http://{address}"
         # size in WxH format
         self.size = (width, height)
 
-    def _get_current_state(self):
+        # device state, pushed by WLED as it changes
+        self.device_state = get_state_subscriber(self.base_url)
+        self.device_state.start()
+
+    async def _get_current_state(self):
         """
         gets the current state of the WLED target
         """
-        resp = requests.get(f"{self.address}/json/state")
-        return resp.json()
+        async with get_session().get(f"{self.base_url}{WLED_JSON_UPDATE_PATH}") as resp:
+            resp.raise_for_status()
+            return await resp.json()
 
-    def _send_json(self, headers, json, path: str, extra_headers=False):
+    async def _send_json(self, headers, json, path: str):
         """
-        :param data: JSON object to be sent to WLED
+        :param json: JSON object to be sent to WLED
         :return: nothing
         """
-        if extra_headers:
-            headers["Content-Length"] = str(len(json))
+        async with get_session().post(f"{self.base_url}{path}", json=json, headers=headers) as resp:
+            resp.raise_for_status()
 
-        requests.post(
-            f"{self.address}{path}",
-            json=json,
-            headers=headers
-        )
+    async def _send_json_pipelined(self, headers, jsons: list, path: str):
+        """
+        Sends several JSON objects, keeping up to MAX_CONNECTIONS_PER_DEVICE requests in flight.
 
-    def should_update(self):
+        :param jsons: JSON objects to be sent to WLED, must not depend on each other's order
+        :return: nothing
+        """
+        await asyncio.gather(*[self._send_json(headers, json, path) for json in jsons])
+
+    async def should_update(self):
         """
         checks if WLED target should be updated
         If some animation is running, i.e. "Spotify mode" isn't running
@@ -52,16 +61,22 @@ class BaseWLEDHandler():
         # 2. WLED is on, but not in "Spotify mode"
 
         # WLED is off, then just shouldn't update anymore
-        if self._get_current_state()["on"] is False:
+        # the pushed state is used when connected, without any request
+        if self.device_state.connected:
+            is_on = self.device_state.is_on()
+        else:
+            is_on = (await self._get_current_state())["on"]
+
+        if is_on is False:
             return False
         else:
             # TODO: have to implement some way to check if WLED is in "Spotify mode"
             # maybe use "v" flag, and check current WLED state if it matches the album cover
             return True
 
-    def on(self, on_state: bool):
+    async def on(self, on_state: bool):
         """
         turns on/off WLED target
         """
         json = {"on": on_state}
-        self._send_json(headers, json, WLED_JSON_UPDATE_PATH)
+        await self._send_json(headers, json, WLED_JSON_UPDATE_PATH)
@@ -1,7 +1,14 @@
-from handlers.wled.wled_handler import BaseWLEDHandler
-from utils.image_utils import downscale_image, scale_brightness
+import asyncio
 
-MAX_PER_REQUEST = 1024   # max colors to be specified in each request to WLED, 256 is the max
+import numpy as np
+from PIL import Image
+
+from handlers.wled.wled_handler import BaseWLEDHandler, headers, WLED_JSON_UPDATE_PATH
+from utils.image_utils import get_cover, scale_brightness, image_to_rgb_array
+
+# max colors to be specified in each request to WLED
+# WLED parses each request into a fixed-size JSON buffer, 256 colors fit even on ESP8266
+MAX_PER_REQUEST = 256
 
 TARGET_IMAGE_BRIGHTNESS = 150   # the brightness of image to be scaled to (0 - 255)
 ENABLE_IMAGE_BRIGHTNESS_SCALING = True  # enable/disable image brightness scaling
@@ -10,56 +17,45 @@ WLED_BASE_BRIGHTNESS = 150    # WLED brightness (0 - 255)
 
 class WLEDJson(BaseWLEDHandler):
     def __init__(self, address: str, width: int, height: int):
-        self.address = address
         # size in WxH format
         super().__init__(address, width, height)
 
-        # TODO: move to image_utils
+    def __convert_image_to_json(self, pixels: np.ndarray):
+        """
+        Packs the pixels into segment updates, of up to MAX_PER_REQUEST colors each.
 
-    def __convert_image_to_json_single(self, image):
+        :param pixels: (pixels, 3) uint8 array of RGB values
+        :return: list of segment objects, in the format of WLED's individual LED control
+        """
         # TODO: implement other color addressing modes (Hybrid, Range)
-        # TODO: fix missing pixel in each segment
-        # whatever the segment size is, the last pixel is skipped for some reason
-        pixel_data = list(image.convert("RGB").getdata())
-        segmented_data = []
-        color_index = 0
-
-        while color_index < len(pixel_data):
-            print(f"color_index is {color_index}")
-            segment = {"seg": {"id": 0, "i": []}}
-            segment["seg"]["i"].append(color_index)
+        # hex-encode all pixels at once, each pixel is then 6 characters
+        hex_data = np.ascontiguousarray(pixels, dtype=np.uint8).tobytes().hex()
+        hex_colors = [hex_data[i:i + 6] for i in range(0, len(hex_data), 6)]
 
-            for i in range(MAX_PER_REQUEST):
-                r, g, b = pixel_data[color_index]
-                hex_color = f"{r:02x}{g:02x}{b:02x}"
-                segment["seg"]["i"].append(hex_color)
+        return [
+            {"id": 0, "i": [start] + hex_colors[start:start + MAX_PER_REQUEST]}
+            for start in range(0, len(hex_colors), MAX_PER_REQUEST)
+        ]
 
-                color_index += 1
-
-            segmented_data.append(segment)
-
-        return segmented_data
-
-    def update_cover(self, image):
+    async def update_cover(self, url: str):
         """
         updates WLED target with album cover
         # TODO: add some warnings (flashing light or something when API error)
+
+        :param url: URL of the cover, or None to turn off the target
         """
+        if url is None:
+            await self.on(False)
+            return
 
-        if image is not None:
-            image = downscale_image(image, self.size)
+        pixels = await asyncio.to_thread(get_cover, url, self.size)
 
-            if ENABLE_IMAGE_BRIGHTNESS_SCALING:
-                image = scale_brightness(image, TARGET_IMAGE_BRIGHTNESS)
+        if ENABLE_IMAGE_BRIGHTNESS_SCALING:
+            # the cover keeps its aspect ratio, and brightness scaling does not depend on the shape anyway
+            image = Image.fromarray(pixels.reshape(1, -1, 3), "RGB")
+            pixels = image_to_rgb_array(scale_brightness(image, TARGET_IMAGE_BRIGHTNESS))
 
-            data = self.__convert_image_to_json_single(image)
+        jsons = [{"seg": segment} for segment in self.__convert_image_to_json(pixels)]
+        jsons[0].update({"on": True, "bri": WLED_BASE_BRIGHTNESS})
 
-            for segment in data:
-                json = {"on": True,
-                        "bri": WLED_BASE_BRIGHTNESS,
-                        "seg": segment["seg"]}
-                # TODO: faster updates
-                self._send_json(headers, json, WLED_JSON_UPDATE_PATH)
-        else:
-            json = {"on": False}
-            self._send_json(headers, json, WLED_JSON_UPDATE_PATH)
\ No newline at end of file
+        await self._send_json_pipelined(headers, jsons, WLED_JSON_UPDATE_PATH)
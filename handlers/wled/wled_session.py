@@ -0,0 +1,39 @@
+"""
+HTTP session shared by all WLED handlers
+"""
+import aiohttp
+
+# WLED serves requests one at a time, so only a few connections are kept open to each device
+MAX_CONNECTIONS_PER_DEVICE = 2
+
+# time to wait for a response from WLED (in seconds)
+REQUEST_TIMEOUT = 5
+
+# HTTP session shared by all WLED handlers, connections are kept alive between requests
+_session: aiohttp.ClientSession | None = None
+
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    :return: the shared HTTP session, created on first use. Must be called from the event loop.
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=MAX_CONNECTIONS_PER_DEVICE),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+
+    return _session
+
+
+async def close_session():
+    """
+    Closes the shared HTTP session, if open.
+    """
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
@@ -0,0 +1,148 @@
+"""
+Push-based tracking of the WLED device state, over the WLED WebSocket
+"""
+import asyncio
+import random
+from typing import Callable
+
+import aiohttp
+
+from handlers.wled.wled_session import get_session
+
+WLED_WEBSOCKET_PATH = "/ws"
+
+# delays (in seconds) before reconnecting, doubled on each failed attempt
+RECONNECT_MIN_BACKOFF = 1
+RECONNECT_MAX_BACKOFF = 30
+
+
+class WLEDStateSubscriber:
+    def __init__(self, base_url: str):
+        """
+        Keeps one WebSocket connection to a WLED device, caching its state as WLED pushes changes.
+
+        WLED pushes its full state on connect, and again on every change (e.g. turned off from the app),
+        so reading the state costs nothing, and changes are seen as soon as they happen.
+        If the connection drops, it is re-established with exponential backoff.
+
+        :param base_url: HTTP URL of the WLED device
+        """
+        self.url = base_url.replace("http", "ws", 1) + WLED_WEBSOCKET_PATH
+        self.connected = False
+
+        # cached state, None until known
+        self.on: bool | None = None
+        self.brightness: int | None = None
+        self.live: bool | None = None
+
+        self.on_event = asyncio.Event()
+        self.listeners: list[Callable[[], None]] = []
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        """
+        Starts the subscription in the background, if not yet running. Must be called from the event loop.
+        """
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.__run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        self.connected = False
+
+    def add_listener(self, listener: Callable[[], None]):
+        """
+        Registers a function to be called whenever the device is turned on.
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def is_on(self) -> bool:
+        """
+        :return: False only if the device is known to be off
+        """
+        return self.on is not False
+
+    async def wait_until_on(self):
+        """
+        Waits until the device is turned on (returns right away if it is not known to be off).
+        """
+        await self.on_event.wait()
+
+    def update(self, message: dict):
+        """
+        Updates the cached state from a WLED state message.
+
+        :param message: JSON message pushed by WLED, containing "state" and/or "info"
+        """
+        state = message.get("state", {})
+        info = message.get("info", {})
+
+        if "on" in state:
+            self.on = state["on"]
+        if "bri" in state:
+            self.brightness = state["bri"]
+        if "live" in info:
+            self.live = info["live"]
+
+        if self.is_on():
+            if not self.on_event.is_set():
+                self.on_event.set()
+
+                for listener in self.listeners:
+                    listener()
+        else:
+            self.on_event.clear()
+
+    def __reset(self):
+        self.connected = False
+        self.on = None
+        self.brightness = None
+        self.live = None
+        # state is unknown again, so nobody should wait for it
+        self.on_event.set()
+
+    async def __run(self):
+        backoff = RECONNECT_MIN_BACKOFF
+        self.on_event.set()
+
+        while True:
+            try:
+                async with get_session().ws_connect(self.url, heartbeat=30) as ws:
+                    self.connected = True
+                    backoff = RECONNECT_MIN_BACKOFF
+
+                    async for msg in ws:
+                        if msg.type is aiohttp.WSMsgType.TEXT:
+                            self.update(msg.json())
+                        elif msg.type is aiohttp.WSMsgType.ERROR:
+                            break
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"WARN - WLED WebSocket {self.url} failed: {e}")
+
+            self.__reset()
+
+            # jitter avoids reconnecting in lockstep with other clients
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, RECONNECT_MAX_BACKOFF)
+
+
+# subscribers are shared, so each device only has one WebSocket connection per process
+_subscribers: dict[str, WLEDStateSubscriber] = {}
+
+
+def get_state_subscriber(base_url: str) -> WLEDStateSubscriber:
+    """
+    :param base_url: HTTP URL of the WLED device
+    :return: the shared WLEDStateSubscriber of the device
+    """
+    if base_url not in _subscribers:
+        _subscribers[base_url] = WLEDStateSubscriber(base_url)
+
+    return _subscribers[base_url]
@@ -1,6 +1,7 @@
 from handlers.main_http_handler import AioMainHTTPHandler
+from handlers.spotify_session import SpotifySession, DeviceConfig
 from utils.common import get_client_id, get_client_secret, WLEDMode
-import socket
+from utils.loop_watchdog import install_fast_event_loop
 
 """
 USER SETTINGS
@@ -22,28 +23,57 @@ There are two modes of operation for WLED:
 """
 WLED_MODE = WLEDMode.ARTNET
 
+"""
+Several Spotify accounts, each displayed on its own devices, can be served by one process.
+Covers, HTTP connections and the Spotify rate-limit budget are then shared between them.
+Each account is authorized once, its token is cached in .cache-<name>.
+
+If empty, the account of confs/ is displayed on TARGET.
+
+Example:
+SESSIONS = [
+    SpotifySession('alice', '<client id>', '<client secret>', [
+        DeviceConfig('wled-living-room.local', 32, 32),
+        DeviceConfig('wled-kitchen.local', 16, 16)
+    ]),
+    SpotifySession('bob', '<client id>', '<client secret>', [
+        DeviceConfig('wled-bedroom.local', 32, 32)
+    ])
+]
+
+Matrices wired differently than row by row, or built from several panels, are described by their panels
+(see handlers/artnet/layout.py). Panels may be driven by other devices than the one of the matrix:
+    from handlers.artnet.layout import Panel
+
+    # 64x32 wall of two serpentine 32x32 panels, the right one driven by a second device
+    DeviceConfig('wled-wall-left.local', 64, 32, panels=[
+        Panel(32, 32, x=0, y=0, serpentine=True),
+        Panel(32, 32, x=32, y=0, serpentine=True, address='wled-wall-right.local')
+    ])
+"""
+SESSIONS = []
+
 """
 Main entrypoint
 """
 if __name__ == '__main__':
-    try:
-        target_ip = socket.gethostbyname(TARGET)
-    except socket.gaierror:
-        print(f'Could not resolve IP address for {TARGET}.')
-        exit(1)
-    except Exception as e:
-        print(f'Unknown error occurred while resolving IP address for {TARGET}.\nCaught exception: {e}')
-        exit(1)
-
-    handler = AioMainHTTPHandler(
-        get_client_id(),
-        get_client_secret(),
-        target_ip,
-        WLED_MODE,
-        TARGET_WIDTH,
-        TARGET_HEIGHT
-    )
-
-    print(f"Starting SpotifyWLED for device: {TARGET} ({target_ip})")
+    sessions = SESSIONS or [
+        SpotifySession(
+            'default',
+            get_client_id(),
+            get_client_secret(),
+            [DeviceConfig(TARGET, TARGET_WIDTH, TARGET_HEIGHT, WLED_MODE)],
+            default=True
+        )
+    ]
+
+    # targets are resolved in the background (ArtPoll discovery, then name lookup),
+    # so startup does not wait for mDNS
+    handler = AioMainHTTPHandler(sessions)
+
+    print(f"Using {install_fast_event_loop()} event loop")
+
+    for session in sessions:
+        print(f"Starting SpotifyWLED for session {session.name}: {', '.join(d.address for d in session.devices)}")
 
     handler.run()
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+
+from handlers.artnet.artnet_sender import ArtNetSender
+from handlers.artnet.recording import FrameRecording, replay
+from handlers.artnet.target_resolver import get_resolver, ARTNET_PORT
+
+"""
+Replays a recording of ArtNet output (see RECORD_FRAMES in confs/global_confs.py) to a WLED device,
+without Spotify. Useful to show animations, and as a repeatable workload for the output layer.
+
+Usage:
+    python replay.py confs/recording-wled-frame.local.bin wled-frame.local
+    python replay.py confs/recording-wled-frame.local.bin wled-frame.local --fast
+"""
+
+
+async def main(args):
+    recording = FrameRecording(args.recording)
+    print(f"Replaying {len(recording)} frames ({recording.duration:.1f}s) to {args.target}")
+
+    resolver = get_resolver(args.target)
+    sender = ArtNetSender(
+        None,
+        ARTNET_PORT,
+        on_send_failure=resolver.report_failure,
+        on_send_success=resolver.report_success
+    )
+    resolver.subscribe(sender.set_address)
+    resolver.start()
+    sender.start()
+
+    # wait for the target, so the first frames are not dropped
+    if await resolver.resolve() is None:
+        print(f"ERROR - could not resolve {args.target}")
+        sender.stop()
+        return
+
+    start_time = asyncio.get_running_loop().time()
+    try:
+        await replay(recording, sender, None if args.fast else args.speed, args.loop)
+        # the last frames may still be queued, they count in the elapsed time too
+        await asyncio.to_thread(sender.flush)
+    finally:
+        elapsed = asyncio.get_running_loop().time() - start_time
+        sender.stop()
+        recording.close()
+        print(f"Sent {sender.sent_frames} frames in {elapsed:.2f}s "
+              f"({sender.dropped_frames} dropped, {sender.failed_frames} failed)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replays a recording of ArtNet output")
+    parser.add_argument('recording', help="path of the recording file")
+    parser.add_argument('target', help="IP address, hostname or mDNS name of the ArtNet node")
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed relative to the original timing")
+    parser.add_argument('--fast', action='store_true', help="send frames as fast as possible")
+    parser.add_argument('--loop', action='store_true', help="replay until interrupted")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,147 @@
+"""
+Fakes of the outside world (Spotify, WLED, ArtNet output), to run animation loops on a VirtualClock
+
+Nothing here starts a thread or opens a connection, so time only advances when the loop is idle.
+"""
+import asyncio
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from confs.global_confs import POLLING_SECONDS
+from handlers.artnet.artnet_handler import WLEDArtNetMode
+from handlers.spotify_api_handler import SpotifyAPIHandler, TrackObject, AudioFeatures
+from handlers.spotify_rate_limiter import SpotifyRateBudget
+from handlers.wled import WLEDArtNet
+from handlers.wled.artnet.animations import AnimationEngine
+from handlers.wled.wled_state import WLEDStateSubscriber
+from utils.clock import monotonic
+
+
+def fake_cover(url: str, size: (int, int)):
+    """
+    Stands in for utils.image_utils.get_cover: a cover of a single color, derived from its URL.
+    """
+    color = zlib.crc32(url.encode()).to_bytes(4, 'little')[:3]
+    pixels = np.tile(np.frombuffer(color, dtype=np.uint8) | 0x40, (size[0] * size[1], 1))
+    pixels.flags.writeable = False
+    return pixels
+
+
+class FakeSpotify:
+    def __init__(self, tracks: list[tuple[str, float]], tempo: float = 120.0):
+        """
+        Stands in for spotipy.Spotify: plays the given tracks one after the other, from the time of the first call.
+
+        :param tracks: list of (track ID, duration in seconds), nothing is playing after the last one
+        :param tempo: tempo of every track (in BPM)
+        """
+        self.tracks = tracks
+        self.tempo = tempo
+        self.start_time = None
+        self.calls = Counter()
+
+    def current(self) -> tuple[str, float, float] | None:
+        """
+        :return: (track ID, duration, progress) of the playing track, None if nothing is playing
+        """
+        if self.start_time is None:
+            self.start_time = monotonic()
+
+        elapsed = monotonic() - self.start_time
+        for track_id, duration in self.tracks:
+            if elapsed < duration:
+                return track_id, duration, elapsed
+            elapsed -= duration
+
+        return None
+
+    def currently_playing(self):
+        self.calls["currently_playing"] += 1
+
+        current = self.current()
+        if current is None:
+            return None
+
+        track_id, duration, progress = current
+        return {
+            "item": {
+                "id": track_id,
+                "name": track_id,
+                "duration_ms": int(duration * 1000),
+                "album": {"images": [{"url": f"https://covers.test/{track_id}.jpg"}]}
+            },
+            "progress_ms": int(progress * 1000),
+            "is_playing": True
+        }
+
+    def audio_features(self, track_id: str):
+        self.calls["audio_features"] += 1
+        return [{"tempo": self.tempo, "energy": 0.5, "danceability": 0.5}]
+
+
+class FakeSpotifyAPIHandler(SpotifyAPIHandler):
+    def __init__(self, spotify: FakeSpotify):
+        """
+        SpotifyAPIHandler on a FakeSpotify, without OAuth or token refresh thread.
+        Calls still go through a rate budget of their own.
+        """
+        self.spotify = spotify
+        self.rate_budget = SpotifyRateBudget()
+
+        self.current_track: TrackObject = TrackObject(None)
+        self.audio_features: AudioFeatures = AudioFeatures.empty()
+        self.last_update_time = float('-inf')
+
+
+class FakeArtNetOutput:
+    def __init__(self, leds: int, mode: WLEDArtNetMode = WLEDArtNetMode.MULTI_RGB):
+        """
+        Stands in for ArtNetHandler: frames are counted, with the time they were sent at, instead of sent.
+        """
+        self.leds = leds
+        self.mode = mode
+        self.dropped_frames = 0
+        self.brightness = 255
+        self.closed = False
+
+        # (time sent, pixels) of every frame
+        self.frames: list[tuple[float, np.ndarray]] = []
+
+    @property
+    def sent_frames(self) -> int:
+        return len(self.frames)
+
+    def close(self):
+        self.closed = True
+
+    def set_brightness(self, brightness: int):
+        self.brightness = brightness
+
+    async def set_pixels(self, pixels: np.ndarray, brightness: int = None):
+        if brightness is not None:
+            self.brightness = brightness
+
+        # only the first pixel is kept, covers are single-colored
+        self.frames.append((monotonic(), np.array(pixels[0])))
+
+
+class FakeWLEDArtNet(WLEDArtNet):
+    def __init__(self, width: int, height: int, api_handler: SpotifyAPIHandler):
+        """
+        WLEDArtNet with a FakeArtNetOutput, and a device state that is never connected (on until told otherwise).
+        Turn the device off or on with self.device_state.update({"state": {"on": False}}).
+        """
+        self.address = 'fake-device'
+        self.base_url = 'http://fake-device'
+        self.size = (width, height)
+        self.device_state = WLEDStateSubscriber(self.base_url)
+
+        self.api_handler = api_handler
+        self.current_tid = None
+
+        self.handler = FakeArtNetOutput(width * height)
+        self.engine = AnimationEngine(width, height, self.handler, api_handler, self.device_state)
+        self.update_lock = asyncio.Lock()
+        self.polling_seconds = POLLING_SECONDS
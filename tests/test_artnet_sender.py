@@ -0,0 +1,31 @@
+"""
+Byte-level checks of the ArtNet packets
+"""
+import unittest
+
+from handlers.artnet.artnet_sender import build_artdmx_packet
+
+
+class ArtDmxPacket(unittest.TestCase):
+    def test_header(self):
+        for universe, port_address in [(0, b'\x00\x00'), (1, b'\x01\x00'), (0x1234, b'\x34\x12')]:
+            packet = build_artdmx_packet(universe, 7, bytes(510))
+
+            self.assertEqual(packet[:8], b'Art-Net\x00')
+            # OpCode (little-endian), ProtVer 14 (big-endian), Sequence, Physical
+            self.assertEqual(packet[8:14], b'\x00\x50\x00\x0e\x07\x00')
+            # SubUni then Net: little-endian port address
+            self.assertEqual(packet[14:16], port_address)
+            # Length (big-endian)
+            self.assertEqual(packet[16:18], b'\x01\xfe')
+            self.assertEqual(len(packet), 18 + 510)
+
+    def test_odd_length_is_padded(self):
+        packet = build_artdmx_packet(0, 1, b'\xff' * 3)
+
+        self.assertEqual(packet[16:18], b'\x00\x04')
+        self.assertEqual(packet[18:], b'\xff\xff\xff\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+"""
+Long-run simulations of an ArtNet animation loop on a VirtualClock
+
+Run with: python -m pytest tests (or python -m unittest discover tests)
+"""
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from confs.global_confs import TARGET_FPS, POLLING_SECONDS, IDLE_TIMEOUT, HIBERNATE_KEEPALIVE_SECONDS
+from handlers.main_loops.ArtNetLoop import ArtNetLoop
+from tests.fakes import FakeSpotify, FakeSpotifyAPIHandler, FakeWLEDArtNet, fake_cover
+from utils.clock import VirtualClock, monotonic, get_clock
+
+HOUR = 60 * 60
+
+
+class ArtNetLoopSimulation(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch('handlers.wled.artnet.animations.get_cover', fake_cover),
+            mock.patch('handlers.wled.artnet.animations.get_palette_cover', fake_cover)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        self.snapshot_path = os.path.join(snapshot_dir.name, 'snapshot.bin')
+
+    def simulate(self, spotify: FakeSpotify, duration: float, during=None) -> FakeWLEDArtNet:
+        """
+        Runs an ArtNetLoop on a FakeWLEDArtNet for the given virtual time.
+
+        :param during: coroutine function called with the device right after the start, if any
+        :return: the device, once its loop has stopped
+        """
+        device = None
+
+        async def simulation():
+            nonlocal device
+            device = FakeWLEDArtNet(32, 32, FakeSpotifyAPIHandler(spotify))
+            loop = ArtNetLoop(device, self.snapshot_path)
+            task = loop.run()
+
+            if during is not None:
+                await during(device)
+
+            await asyncio.sleep(duration - monotonic())
+            loop.stop()
+            await task
+
+        VirtualClock().run(simulation())
+        return device
+
+    def test_hour_of_playback(self):
+        # 20 tracks of 3 minutes
+        spotify = FakeSpotify([(f"track-{i}", 180.0) for i in range(20)])
+
+        start = time.perf_counter()
+        device = self.simulate(spotify, HOUR)
+        self.assertLess(time.perf_counter() - start, 120, "an hour should simulate in seconds")
+
+        output = device.handler
+        self.assertTrue(output.closed)
+        self.assertAlmostEqual(output.sent_frames, HOUR * TARGET_FPS, delta=TARGET_FPS)
+
+        # one poll per interval, and the audio features of each track once
+        self.assertAlmostEqual(spotify.calls["currently_playing"], HOUR / POLLING_SECONDS, delta=2)
+        self.assertEqual(spotify.calls["audio_features"], 20)
+        self.assertEqual(device.api_handler.rate_budget.throttled_calls, 0)
+
+        # the cover changes at most a poll interval (and a frame) after the track
+        for i in range(1, 20):
+            change_time = spotify.start_time + i * 180.0
+            new_color = fake_cover(f"https://covers.test/track-{i}.jpg", (1, 1))[0]
+            first_frame = next(t for t, pixel in output.frames if t >= change_time and _same_hue(pixel, new_color))
+            self.assertLessEqual(first_frame - change_time, POLLING_SECONDS + 2 / TARGET_FPS)
+
+        # the frame is sent within a frame of the poll that saw the change
+        self.assertLessEqual(device.engine.first_frame_latency, 1 / TARGET_FPS)
+
+    def test_first_frame_latency_includes_cover_processing(self):
+        spotify = FakeSpotify([("track-0", 60.0), ("track-1", 60.0)])
+        condition = threading.Condition()
+
+        def slow_cover(url, size):
+            # takes half a second of virtual time, while the previous cover keeps being animated
+            with condition:
+                get_clock().wait(condition, 0.5)
+            return fake_cover(url, size)
+
+        with mock.patch('handlers.wled.artnet.animations.get_cover', slow_cover):
+            device = self.simulate(spotify, 90)
+
+        self.assertGreaterEqual(device.engine.first_frame_latency, 0.5)
+        self.assertLessEqual(device.engine.first_frame_latency, 0.5 + 2 / TARGET_FPS)
+
+    def test_idle_hibernation(self):
+        # a single minute of music, then nothing for the rest of the hour
+        spotify = FakeSpotify([("track-0", 60.0)])
+
+        device = self.simulate(spotify, HOUR)
+
+        self.assertTrue(device.engine.is_hibernating())
+
+        # frames while playing, until the end is polled and the idle timeout, then only keepalives
+        active_frames = (60 + POLLING_SECONDS + IDLE_TIMEOUT) * TARGET_FPS
+        keepalives = (HOUR - 60 - IDLE_TIMEOUT) / HIBERNATE_KEEPALIVE_SECONDS
+        self.assertAlmostEqual(device.handler.sent_frames, active_frames + keepalives, delta=2 * TARGET_FPS)
+
+        # polling backs off while hibernating
+        self.assertLess(spotify.calls["currently_playing"], (60 + IDLE_TIMEOUT) / POLLING_SECONDS + 100)
+
+    def test_stop_while_device_is_off(self):
+        spotify = FakeSpotify([("track-0", HOUR)])
+
+        async def turn_off(device):
+            await asyncio.sleep(60)
+            device.device_state.update({"state": {"on": False}})
+
+        device = self.simulate(spotify, 120, turn_off)
+
+        # stopping does not wait for the device to turn on again
+        self.assertTrue(device.handler.closed)
+        self.assertAlmostEqual(device.handler.sent_frames, 60 * TARGET_FPS, delta=TARGET_FPS)
+
+
+    def test_polling_survives_a_failed_poll(self):
+        spotify = FlakySpotify([("track-0", 60.0), ("track-1", 60.0)], failing_call=3)
+
+        device = self.simulate(spotify, 90)
+
+        # the failed poll is logged, the following ones see the second track
+        self.assertGreater(spotify.calls["currently_playing"], 3 + 60 / POLLING_SECONDS)
+        self.assertEqual(device.current_tid, "track-1")
+        self.assertEqual(spotify.calls["audio_features"], 2)
+
+
+    def test_track_without_tempo(self):
+        spotify = FakeSpotify([("track-0", 60.0)], tempo=0.0)
+
+        device = self.simulate(spotify, 30)
+
+        # the steady effect is kept, frames keep being sent
+        self.assertIsNotNone(device.engine.audio_effect_latency)
+        self.assertAlmostEqual(device.handler.sent_frames, 30 * TARGET_FPS, delta=TARGET_FPS)
+
+
+class FlakySpotify(FakeSpotify):
+    def __init__(self, tracks: list[tuple[str, float]], failing_call: int):
+        """
+        FakeSpotify whose given call of currently_playing (counted from 1) raises, as a dropped connection would.
+        """
+        super().__init__(tracks)
+        self.failing_call = failing_call
+
+    def currently_playing(self):
+        if self.calls["currently_playing"] + 1 == self.failing_call:
+            self.calls["currently_playing"] += 1
+            raise ConnectionError("connection reset by peer")
+
+        return super().currently_playing()
+
+
+class VirtualClockThreads(unittest.TestCase):
+    def test_time_stands_still_while_loop_threads_run(self):
+        clock = VirtualClock()
+        condition = threading.Condition()
+
+        def outside_wait():
+            # a thread not started by the loop (e.g. a token refresh) waiting on the clock
+            with condition:
+                clock.wait(condition, 1.0)
+
+        def blocking_call():
+            before = monotonic()
+            time.sleep(0.2)
+            return monotonic() - before
+
+        async def simulation():
+            outside = threading.Thread(target=outside_wait)
+            outside.start()
+            await asyncio.sleep(0.5)
+
+            elapsed, _ = await asyncio.gather(asyncio.to_thread(blocking_call), asyncio.sleep(10))
+            outside.join()
+            return elapsed
+
+        self.assertEqual(clock.run(simulation()), 0.0)
+        self.assertEqual(clock.busy, 0)
+
+
+def _same_hue(pixel, color) -> bool:
+    # frames are the cover scaled by the brightness of the effect
+    return bool(np.all(np.abs(pixel / pixel.max() - color / color.max()) < 0.08))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,9 +12,13 @@ class ManagedCoroutineFunction:
         - _main_function: the main logic of the coroutine function
         - _stop_function: the function that determines when the coroutine should stop
 
+    Subclasses may implement the following:
+        - _cleanup_function: releases resources once the coroutine has stopped
+        - _stop_interval: the time to wait between calls of _stop_function
+
     The coroutine will stop in the following cases:
         - _stop_function calls stop_event.is_set()
-        - stop() is called
+        - stop() is called, which also interrupts _main_function if it is waiting
     """
     def __init__(self):
         """
@@ -23,7 +27,11 @@ class ManagedCoroutineFunction:
         super().__init__(*args, **kwargs) must be used in the subclass.
         """
         self.stop_event = asyncio.Event()
+        self.wake_event = asyncio.Event()
         self.loop = asyncio.get_event_loop()
+        self.main_task: asyncio.Task | None = None
+        self.stop_task: asyncio.Task | None = None
+        self.__interruptible = False
 
     @final
     def run(self):
@@ -34,8 +42,9 @@ class ManagedCoroutineFunction:
 
         :return: the asyncio.Task that is running the coroutine function
         """
-        self.loop.create_task(self.__stop_loop())
-        return self.loop.create_task(self.__main_loop())
+        self.stop_task = self.loop.create_task(self.__stop_loop())
+        self.main_task = self.loop.create_task(self.__main_loop())
+        return self.main_task
 
     @final
     def stop(self):
@@ -43,6 +52,19 @@ class ManagedCoroutineFunction:
         Stops the coroutine function manually.
         """
         self.stop_event.set()
+        self.wake_event.set()
+
+        # the main function may be waiting for something only stop() ends, e.g. a device turning on
+        # (a main loop that has not started yet ends by itself, and the cleanup is never interrupted)
+        if self.__interruptible:
+            self.main_task.cancel()
+
+    @final
+    def wake(self):
+        """
+        Calls _stop_function right away, instead of waiting for the rest of the interval.
+        """
+        self.wake_event.set()
 
     async def _main_function(self):
         """
@@ -58,13 +80,53 @@ class ManagedCoroutineFunction:
         """
         raise NotImplementedError
 
+    def _stop_interval(self) -> float:
+        """
+        Time to wait between calls of _stop_function (in seconds).
+        """
+        return POLLING_SECONDS
+
+    async def _cleanup_function(self):
+        """
+        Function to release any resources held, called once after the main loop stops.
+        """
+        pass
+
     @final
     async def __stop_loop(self):
         while not self.stop_event.is_set():
-            await asyncio.sleep(POLLING_SECONDS)
-            await self._stop_function()
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), self._stop_interval())
+            except asyncio.TimeoutError:
+                pass
+
+            self.wake_event.clear()
+
+            if not self.stop_event.is_set():
+                await self._stop_function()
 
     @final
     async def __main_loop(self):
-        while not self.stop_event.is_set():
-            await self._main_function()
+        self.__interruptible = True
+        try:
+            while not self.stop_event.is_set():
+                await self._main_function()
+        except asyncio.CancelledError:
+            # cancelled by stop(), any other cancellation is propagated
+            if not self.stop_event.is_set():
+                raise
+        finally:
+            self.__interruptible = False
+
+            # the stop loop ends with the main loop, whatever ended it
+            self.stop_event.set()
+            self.wake_event.set()
+
+            # _stop_function may still be using the resources
+            try:
+                await self.stop_task
+            except Exception as e:
+                print(f"WARN - stop loop failed: {e}")
+
+            # resources are released even if the main function failed
+            await self._cleanup_function()
@@ -0,0 +1,228 @@
+"""
+Injectable clock
+
+Code timed by the event loop reads the time from the current clock (monotonic(), wall_time()),
+instead of the time module. By default this is the system clock.
+
+VirtualClock runs an event loop on virtual time: whenever the loop (and its threads) would wait,
+time jumps straight to the next scheduled callback or deadline. asyncio.sleep, wait_for and call_later all follow virtual time,
+so hours of animation, polling and timeouts run in seconds (code running only on the loop runs
+in the same order every time):
+
+    clock = VirtualClock()
+    clock.run(simulation())     # e.g. runs an ArtNetLoop for an hour, then checks frame and call counts
+
+see tests/test_virtual_clock.py
+"""
+import asyncio
+import time
+from threading import Condition, Lock, get_ident
+from typing import Coroutine
+
+
+class SystemClock:
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+    def wait(self, condition: Condition, timeout: float):
+        """
+        Waits on a condition (its lock must be held) for up to the given time.
+        """
+        condition.wait(timeout)
+
+
+class _Sleeper:
+    __slots__ = ('deadline', 'condition', 'counted', 'woken')
+
+    def __init__(self, deadline: float, condition: Condition, counted: bool):
+        self.deadline = deadline
+        self.condition = condition
+        # whether the thread is counted as busy while it is not waiting
+        self.counted = counted
+        self.woken = False
+
+
+class VirtualClock:
+    def __init__(self, start: float = 0.0, epoch: float = 1_700_000_000.0):
+        """
+        Clock that only advances when the event loop, and every thread it started, has nothing to do.
+
+        Functions run with asyncio.to_thread still run in threads, time stands still until they finish
+        or wait on this clock. Other threads (ArtNet senders, token refresh, WLED state) run on real time,
+        so they should be replaced with fakes (see tests/fakes.py).
+
+        :param start: monotonic time to start at (in seconds)
+        :param epoch: wall-clock time at the start (in seconds since the epoch)
+        """
+        self.now = start
+        self.epoch = epoch - start
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+        # number of threads running a function of the loop (and their IDs), and threads waiting for a virtual deadline
+        self.lock = Lock()
+        self.busy = 0
+        self.busy_threads: set[int] = set()
+        self.sleepers: list[_Sleeper] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.epoch + self.now
+
+    def wait(self, condition: Condition, timeout: float):
+        with self.lock:
+            # only threads started by the loop are counted, other threads are not waited for anyway
+            sleeper = _Sleeper(self.now + timeout, condition, get_ident() in self.busy_threads)
+            if sleeper.counted:
+                self.busy -= 1
+            self.sleepers.append(sleeper)
+
+        # the loop may be waiting for this thread, let it advance time
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(lambda: None)
+
+        # woken up by the loop at the deadline, or notified by another thread
+        condition.wait()
+
+        with self.lock:
+            if not sleeper.woken:
+                sleeper.woken = True
+                if sleeper.counted:
+                    self.busy += 1
+                self.sleepers.remove(sleeper)
+
+    def __advance(self, timeout: float | None) -> bool:
+        """
+        Jumps to the next due callback of the loop, or deadline of a waiting thread.
+
+        :param timeout: time until the next callback of the loop, None if there is none
+        :return: False if there is nothing to jump to
+        """
+        with self.lock:
+            deadlines = [s.deadline for s in self.sleepers]
+            if timeout is not None:
+                deadlines.append(self.now + timeout)
+
+            if not deadlines:
+                return False
+
+            self.now = max(self.now, min(deadlines))
+
+            due = [s for s in self.sleepers if s.deadline <= self.now]
+            for sleeper in due:
+                sleeper.woken = True
+                if sleeper.counted:
+                    self.busy += 1
+                self.sleepers.remove(sleeper)
+
+        for sleeper in due:
+            with sleeper.condition:
+                sleeper.condition.notify_all()
+
+        return True
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        :return: a new event loop running on this clock
+        """
+        loop = asyncio.SelectorEventLoop()
+        loop.time = self.monotonic
+        self.loop = loop
+
+        # instead of blocking until the next callback is due, jump to it
+        select = loop._selector.select
+
+        def virtual_select(timeout=None):
+            events = select(0)
+
+            if events or timeout == 0:
+                return events
+
+            # threads are running, they wake up the loop when they finish or wait
+            if self.busy > 0:
+                return select(timeout)
+
+            if not self.__advance(timeout):
+                # nothing scheduled at all, only outside events can wake the loop
+                return select(None)
+
+            return events
+
+        loop._selector.select = virtual_select
+
+        # count the threads running functions of the loop
+        run_in_executor = loop.run_in_executor
+
+        def counted_run_in_executor(executor, function, *args):
+            def run():
+                with self.lock:
+                    self.busy_threads.add(get_ident())
+
+                try:
+                    return function(*args)
+                finally:
+                    with self.lock:
+                        self.busy_threads.discard(get_ident())
+
+            def done(_):
+                with self.lock:
+                    self.busy -= 1
+
+            with self.lock:
+                self.busy += 1
+
+            # only stop counting once the result is back on the loop, so time cannot jump in between
+            future = run_in_executor(executor, run)
+            future.add_done_callback(done)
+            return future
+
+        loop.run_in_executor = counted_run_in_executor
+        return loop
+
+    def run(self, main: Coroutine):
+        """
+        Runs a coroutine on a new event loop on this clock, with this clock as the current clock.
+
+        :param main: the coroutine to run
+        :return: result of the coroutine
+        """
+        previous = get_clock()
+        set_clock(self)
+        loop = self.new_event_loop()
+
+        try:
+            return loop.run_until_complete(main)
+        finally:
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+            set_clock(previous)
+
+
+_clock: SystemClock | VirtualClock = SystemClock()
+
+
+def get_clock() -> SystemClock | VirtualClock:
+    return _clock
+
+
+def set_clock(clock: SystemClock | VirtualClock):
+    global _clock
+    _clock = clock
+
+
+def monotonic() -> float:
+    """
+    :return: monotonic time of the current clock (in seconds)
+    """
+    return _clock.monotonic()
+
+
+def wall_time() -> float:
+    """
+    :return: wall-clock time of the current clock (in seconds since the epoch)
+    """
+    return _clock.time()
@@ -4,7 +4,7 @@ Classes for low-level effects (i.e. effects from pure waveforms)
 import math
 from typing import Callable
 
-from confs.global_confs import TARGET_FPS
+import numpy as np
 
 
 # TODO: move math-related functions to dedicated module
@@ -13,13 +13,84 @@ from confs.global_confs import TARGET_FPS
 class EffectData:
     """
     Data class for effects.
-        - factors: list containing brightness factors for each frame
+        - function: brightness factor as a function of time within one period (in seconds)
         - period: period of the waveform (in seconds)
+
+    Factors are computed lazily for any timestamp, so memory use does not depend on the period.
     """
-    def __init__(self, factors: list[float], period: float):
-        self.factors = factors
+    def __init__(self, function: Callable[[float], float], period: float):
+        self.function = function
         self.period = period
 
+    @classmethod
+    def from_samples(cls, factors, period: float):
+        """
+        Builds an effect that steps through factors sampled evenly over one period.
+
+        :param factors: brightness factors, e.g. from sample()
+        :param period: period of the waveform (in seconds)
+        """
+        def func(i):
+            return float(factors[min(int(len(factors) * i / period), len(factors) - 1)])
+
+        return cls(func, period)
+
+    def factor_at(self, t: float) -> float:
+        """
+        :param t: time since the start of the effect (in seconds)
+        :return: brightness factor at the given time
+        """
+        return self.function(t % self.period)
+
+    def sample(self, fps: float) -> list[float]:
+        """
+        Samples one period of the effect at the given frame rate.
+
+        :param fps: frames per second to sample at
+        :return: list containing brightness factors for each frame
+        """
+        num_factors = int(fps * self.period)
+        return [self.function(self.period * (i / num_factors)) for i in range(num_factors)]
+
+
+class EffectStream:
+    def __init__(self, effect_data: EffectData, timestamp: float):
+        """
+        Streams brightness factors of an effect, for each frame timestamp.
+
+        The stream tracks the phase (fraction of the period elapsed) of the effect, instead of an index
+        into a list of factors. Swapping the effect mid-cycle, e.g. on a tempo change, continues
+        from the same phase, so the waveform does not jump back to its start.
+
+        :param effect_data: the effect to stream
+        :param timestamp: timestamp the effect starts at (in seconds)
+        """
+        self.effect_data = effect_data
+        self.phase = 0.0
+        self.timestamp = timestamp
+
+    def swap(self, effect_data: EffectData):
+        """
+        Replaces the streamed effect, keeping the current phase.
+
+        :param effect_data: the new effect
+        """
+        self.effect_data = effect_data
+
+    def factor_at(self, timestamp: float) -> float:
+        """
+        Advances the stream to the given timestamp.
+
+        :param timestamp: timestamp of the frame (in seconds), must not go backwards
+        :return: brightness factor for the frame
+        """
+        period = self.effect_data.period
+        self.phase = (self.phase + (timestamp - self.timestamp) / period) % 1.0
+        self.timestamp = timestamp
+
+        return self.effect_data.function(self.phase * period)
+
+
 class Effect:
     def __init__(self, width: int, height: int):
         """
@@ -27,12 +98,9 @@ class Effect:
 
         :param width: LED matrix width
         :param height: LED matrix height
-        :param resolution: maximum resolution allowed for effects
-            The actual resolution depends on the effect calculation, as they are
-            calculated according to each effect's formula to avoid the waveform
-            being clipped.
         """
-        self.target_fps = TARGET_FPS
+        self.width = width
+        self.height = height
 
     def _get_effect(self, mode):
         """
@@ -48,22 +116,17 @@ class Effect:
         """
         raise NotImplementedError
 
-    def _calculate_effect(self, function: Callable[..., list[float]], period):
+    def _calculate_effect(self, function: Callable[[float], float], period):
         """
-        Calculates the required data for effects.
+        Wraps the required data for effects.
 
-        Number of brightness factors is always equal to the target FPS.
+        The function is evaluated lazily, for the timestamp of each frame.
 
-        :param function: function used to calculate factors
+        :param function: function used to calculate factors, given the time within the period
         :param period: the period of the effect's waveform
-        :return: EffectData object with brightness factors and period
+        :return: EffectData object with brightness function and period
         """
-        num_factors = int(self.target_fps * period)
-
-        factors = []
-        for i in range(0, num_factors):
-            factors.append(function(period * (i / num_factors)))
-        return EffectData(factors, period)
+        return EffectData(function, period)
 
 
 class WaveformEffects(Effect):
@@ -162,13 +225,192 @@ class WaveformEffects(Effect):
 
         return self._calculate_effect(func, period)
 
+class SamplingMap:
+    def __init__(self, indices: np.ndarray, weights: np.ndarray | None):
+        """
+        Maps a source image onto the target, as a single gather.
+
+        :param indices: (pixels,) source pixel of each target pixel,
+            or (pixels, 4) neighbouring source pixels of each target pixel for bilinear sampling
+        :param weights: (pixels, 4) bilinear weights of the neighbouring source pixels, None for nearest sampling
+        """
+        self.indices = indices
+        self.weights = weights
+
+    def apply(self, source: np.ndarray) -> np.ndarray:
+        """
+        :param source: (source pixels, 3) array of the source image,
+            float32 is blended the fastest for bilinear sampling (see prepare_source)
+        :return: (pixels, 3) uint8 array of the sampled image
+        """
+        if self.weights is None:
+            return np.take(source, self.indices, axis=0).astype(np.uint8, copy=False)
+
+        neighbours = np.take(source, self.indices, axis=0)
+        return np.einsum('pnc,pn->pc', neighbours, self.weights).astype(np.uint8)
+
+
+def prepare_source(source: np.ndarray, bilinear: bool) -> np.ndarray:
+    """
+    :param source: (source pixels, 3) uint8 array of the source image
+    :param bilinear: whether the source is sampled bilinearly
+    :return: the source, in the type sampled the fastest
+    """
+    return source.astype(np.float32) if bilinear else source
+
+
+def sampling_map(source_size: tuple[int, int],
+                 target_size: tuple[int, int],
+                 zoom: float,
+                 center: tuple[float, float],
+                 angle: float,
+                 bilinear: bool) -> SamplingMap:
+    """
+    Computes the sampling map of a view into the source image.
+
+    :param source_size: tuple of (width, height) of the source image
+    :param target_size: tuple of (width, height) of the target
+    :param zoom: magnification of the view, 1 shows the whole source
+    :param center: center of the view, in fractions of the source (0.5, 0.5 is the center)
+    :param angle: rotation of the view (in radians)
+    :param bilinear: if True, blends the 4 nearest source pixels, else takes the nearest one
+    :return: the sampling map
+    """
+    sw, sh = source_size
+    tw, th = target_size
+
+    # target pixel centers, in fractions of the view centered on 0
+    ty, tx = np.mgrid[0:th, 0:tw]
+    u = ((tx.ravel() + 0.5) / tw - 0.5) / zoom
+    v = ((ty.ravel() + 0.5) / th - 0.5) / zoom
+
+    # rotate the view, in source pixels so the aspect ratio is kept
+    cos, sin = math.cos(angle), math.sin(angle)
+    x = center[0] * sw + (u * sw * cos - v * sh * sin) - 0.5
+    y = center[1] * sh + (u * sw * sin + v * sh * cos) - 0.5
+
+    x = np.clip(x, 0, sw - 1)
+    y = np.clip(y, 0, sh - 1)
+
+    if not bilinear:
+        indices = np.rint(y).astype(np.intp) * sw + np.rint(x).astype(np.intp)
+        return SamplingMap(indices, None)
+
+    x0 = np.minimum(np.floor(x).astype(np.intp), sw - 2) if sw > 1 else np.zeros(len(x), np.intp)
+    y0 = np.minimum(np.floor(y).astype(np.intp), sh - 2) if sh > 1 else np.zeros(len(y), np.intp)
+    fx = (x - x0).astype(np.float32)
+    fy = (y - y0).astype(np.float32)
+    x1 = np.minimum(x0 + 1, sw - 1)
+    y1 = np.minimum(y0 + 1, sh - 1)
+
+    indices = np.stack([y0 * sw + x0, y0 * sw + x1, y1 * sw + x0, y1 * sw + x1], axis=1)
+    weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy], axis=1)
+
+    return SamplingMap(indices, weights)
+
+
+class TransformData:
+    """
+    Data class for image-scaling effects.
+        - maps: sampling map of each step, evenly spread over one period
+        - period: period of the effect (in seconds)
+    """
+    def __init__(self, maps: list[SamplingMap], period: float):
+        self.maps = maps
+        self.period = period
+
+    def map_at(self, t: float) -> SamplingMap:
+        """
+        :param t: time (in seconds)
+        :return: sampling map of the step at the given time
+        """
+        return self.maps[int(len(self.maps) * (t % self.period) / self.period) % len(self.maps)]
+
+
 class ScaleEffects(Effect):
     """
     Image-scaling based effects.
-    Currently planned:
+    Views of a higher resolution source image, currently supported types:
         - Zoom
+        - Pan
+        - Rotate
+
+    Each step of an effect is a precomputed SamplingMap, so a frame is a single gather at any frame rate.
     """
-    pass
+    def __init__(self, width: int, height: int, source_width: int, source_height: int,
+                 steps_per_second: float = 24, bilinear: bool = True):
+        """
+        :param width: LED matrix width
+        :param height: LED matrix height
+        :param source_width: width of the source image
+        :param source_height: height of the source image
+        :param steps_per_second: number of distinct views per second
+        :param bilinear: if True, blends neighbouring source pixels, else takes the nearest one
+        """
+        super().__init__(width, height)
+        self.source_size = (source_width, source_height)
+        self.steps_per_second = steps_per_second
+        self.bilinear = bilinear
+
+    def _calculate_transform(self, function: Callable[[float], tuple[float, tuple[float, float], float]],
+                             period: float):
+        """
+        Samples the views of one period, and wraps their sampling maps.
+
+        :param function: (zoom, center, angle) of the view, given the time within the period
+        :param period: the period of the effect
+        :return: TransformData object with the sampling maps and period
+        """
+        steps = max(1, round(period * self.steps_per_second))
+        maps = []
+
+        for step in range(steps):
+            zoom, center, angle = function(period * step / steps)
+            maps.append(sampling_map(self.source_size, (self.width, self.height), zoom, center, angle, self.bilinear))
+
+        return TransformData(maps, period)
+
+    def zoom(self, start: float = 1.0, end: float = 1.5, period: float = 8):
+        """
+        Zooms smoothly into the center of the image, and back out.
+
+        :param start: magnification at the start of the period
+        :param end: magnification at the middle of the period
+        :param period: period of the zoom (in seconds)
+        """
+        def func(i):
+            ease = 0.5 - 0.5 * math.cos(2 * math.pi * i / period)
+            return start + (end - start) * ease, (0.5, 0.5), 0.0
+
+        return self._calculate_transform(func, period)
+
+    def pan(self, zoom: float = 1.5, period: float = 12):
+        """
+        Pans a magnified view around the image, along an ellipse touching its edges.
+
+        :param zoom: magnification of the view
+        :param period: period of one round (in seconds)
+        """
+        # the view stays within the image
+        radius = 0.5 - 0.5 / zoom
+
+        def func(i):
+            phase = 2 * math.pi * i / period
+            return zoom, (0.5 + radius * math.cos(phase), 0.5 + radius * math.sin(phase)), 0.0
+
+        return self._calculate_transform(func, period)
+
+    def rotate(self, zoom: float = 1.42, period: float = 20):
+        """
+        Rotates the image around its center.
+
+        :param zoom: magnification of the view, sqrt(2) keeps the corners within the image
+        :param period: period of one turn (in seconds)
+        """
+        def func(i):
+            return zoom, (0.5, 0.5), 2 * math.pi * i / period
+
+        return self._calculate_transform(func, period)
 
 class OverlayEffects(Effect):
     """
@@ -1,8 +1,6 @@
 """
 Classes for high-level effects
 """
-from math import floor
-
 from handlers.spotify_api_handler import AudioFeatures
 from utils.effects.base_effects import WaveformEffects, EffectData
 
@@ -16,30 +14,45 @@ class PlaybackEffects(WaveformEffects):
         Slowly pulsates image, with a "breathing" animation.
 
         :param breathe_count: number of times to "breathe"
-        :return: list of brightness factors
+        :return: EffectData of the brightness factors
         """
-        # TODO: refactor this lmao
         main_pulse = self.sinus_raw(a=0.3, p=2, v=0.7)
-        breathe_pulse_raw = self.trunc_sinus_raw(a=0.3, p=1, v=0.7)
+        breathe_pulse = self.trunc_sinus_raw(a=0.3, p=1, v=0.7)
+
+        # crest of the main pulse, where the breathing is spliced in
+        main_crest = main_pulse.period / 4
+
+        # the breathing goes from crest to crest of the truncated pulse
+        breathe_start = breathe_pulse.period / 4
+        breathe_length = breathe_pulse.period / 2
+        breathe_duration = breathe_length * breathe_count
 
-        # splice breathe_pulse to get crest-to-crest
-        breathe_pulse_idx = floor(len(breathe_pulse_raw.factors) / 4)
-        breathe_pulse = breathe_pulse_raw.factors[breathe_pulse_idx:-breathe_pulse_idx] * breathe_count
+        def func(i):
+            if i < main_crest:
+                return main_pulse.function(i)
 
-        main_crest_idx = floor(len(main_pulse.factors) / 4)
+            i -= main_crest
+            if i < breathe_duration:
+                return breathe_pulse.function(breathe_start + i % breathe_length)
 
-        spliced_wave = main_pulse.factors[:main_crest_idx] + \
-                       breathe_pulse + \
-                       main_pulse.factors[main_crest_idx:]
+            return main_pulse.function(main_crest + i - breathe_duration)
 
         # splice the main pulse with breathing at the crest
-        return EffectData(spliced_wave, main_pulse.period + ((breathe_pulse_raw.period / 4) * breathe_count))
+        return EffectData(func, main_pulse.period + breathe_duration)
+
+    def steady(self, factor: float = 0.75):
+        """
+        Holds the image at a constant brightness, e.g. until the tempo of the track is known.
+        :param factor: brightness factor
+        :return: EffectData of the brightness factors
+        """
+        return self._calculate_effect(lambda i: factor, 1)
 
     def generic_play(self, period: float = 0.5):
         """
         A generic playing animation, pulsates the image continuously.
         :param period: period of the sin wave
-        :return: list of brightness factors
+        :return: EffectData of the brightness factors
         """
         return self.sinus_raw(a=0.3, p=period, v=0.5)
 
@@ -47,7 +60,7 @@ class PlaybackEffects(WaveformEffects):
         """
         A playing animation that pulsates according to the music BPM
         :param t_audio_features: a dict containing audio features of the track being played
-        :return: list of brightness factors
+        :return: EffectData of the brightness factors
         """
 
         """
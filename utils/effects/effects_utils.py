@@ -1,6 +1,7 @@
 """
 Various utilities related to effects
 """
+import numpy as np
 
 BLACK_THRESHOLD = 30
 
@@ -12,4 +13,13 @@ def is_black(rgb: tuple[int, int, int]) -> bool:
     :return: True if black, False otherwise
     """
     r, g, b = rgb
-    return all([r < BLACK_THRESHOLD, g < BLACK_THRESHOLD, b < BLACK_THRESHOLD])
\ No newline at end of file
+    return all([r < BLACK_THRESHOLD, g < BLACK_THRESHOLD, b < BLACK_THRESHOLD])
+
+def black_mask(pixels: np.ndarray) -> np.ndarray:
+    """
+    Checks which pixels are black, for a whole array of pixels at once
+
+    :param pixels: (pixels, 3) array of RGB values
+    :return: (pixels,) boolean array, True where the pixel is black
+    """
+    return np.all(pixels < BLACK_THRESHOLD, axis=1)
@@ -1,21 +1,95 @@
 import io
+from collections import OrderedDict
+from concurrent.futures import Future
 from functools import lru_cache
+from threading import Lock
+from typing import Callable
 
+import numpy as np
 import requests
 from PIL import Image
 
+from utils.tracing import span
 
-@lru_cache(maxsize=32)
-def get_cover(url: str, size: (int, int)):
+
+class CoverCache:
+    def __init__(self, function: Callable, maxsize: int):
+        """
+        Thread-safe LRU cache of processed covers, shared by every session and device of the process.
+
+        Unlike lru_cache, concurrent requests for a cover that is still being processed
+        wait for that result, so each cover is only downloaded and decoded once.
+
+        :param function: function processing a cover, given (url, size)
+        :param maxsize: maximum number of covers to keep
+        """
+        self.function = function
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple, Future] = OrderedDict()
+        self.lock = Lock()
+
+    def __call__(self, url: str, size: (int, int)):
+        key = (url, tuple(size))
+
+        with self.lock:
+            future = self.entries.get(key)
+            is_owner = future is None
+
+            if is_owner:
+                future = Future()
+                self.entries[key] = future
+
+                if len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+            else:
+                self.entries.move_to_end(key)
+
+        if is_owner:
+            try:
+                future.set_result(self.function(url, size))
+            except BaseException as e:
+                # failures are not cached
+                with self.lock:
+                    self.entries.pop(key, None)
+                future.set_exception(e)
+
+        return future.result()
+
+    def cache_clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _process_cover(url: str, size: (int, int)):
     """
     Downloads and processes image from given URL to be displayed on matrix.
     :param url: image URL
     :param size: tuple of (width, height) of image
-    :return: [R, G, B] array of pixels
+    :return: read-only (width * height, 3) uint8 array of RGB pixels
+    """
+    with span("cover.download", url=url):
+        image = download_image(url)
+
+    with span("cover.process"):
+        image = downscale_image(image, (size[0], size[1]))
+        pixels = image_to_rgb_array(image)
+
+    # cached arrays are shared, so make sure nobody modifies them
+    pixels.flags.writeable = False
+    return pixels
+
+# processed covers, shared across all sessions
+get_cover = CoverCache(_process_cover, maxsize=128)
+
+@lru_cache(maxsize=128)
+def get_palette_cover(url: str, size: (int, int)):
+    """
+    Same as get_cover, but returns the cover as a PaletteImage.
+    :param url: image URL
+    :param size: tuple of (width, height) of image
+    :return: PaletteImage of the cover
     """
-    image = download_image(url)
-    image = downscale_image(image, (size[0], size[1]))
-    return image_to_rgb_array(image)
+    return to_palette_image(get_cover(url, size))
 
 def download_image(url: str):
     response = requests.get(url)
@@ -24,47 +98,97 @@ def download_image(url: str):
 
 
 def downscale_image(image, size):
+    """
+    Decodes the given image, and downscales it to fit in the given size.
+
+    For JPEGs, the decoder scales down by up to 8x in the DCT domain (draft mode), so the full
+    resolution image is never decoded. The rest is done by an integer box reduction,
+    leaving only a small final resize.
+
+    :param image: encoded image bytes
+    :param size: tuple of (width, height) to fit in
+    :return: downscaled image
+    """
     img = Image.open(io.BytesIO(image))
+    img.draft('RGB', size)
+
+    # reduce only supports some modes (not palette or bilevel images), the result is RGB anyway
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    factor = min(img.width // size[0], img.height // size[1])
+    if factor > 1:
+        img = img.reduce(factor)
+
     img.thumbnail(size)
     return img
 
 def calculate_average_brightness(image):
-    grayscale_image = image.convert("L")
-    grayscale_pixels = list(grayscale_image.getdata())
-    total_brightness = sum(grayscale_pixels)
-    num_pixels = len(grayscale_pixels)
-    average_brightness = total_brightness / num_pixels
-    return average_brightness
+    grayscale_pixels = np.asarray(image.convert("L"), dtype=np.float32)
+    return float(grayscale_pixels.mean())
 
 def scale_brightness(image, desired_brightness):
     # TODO: better scaling
     # have to account for: dark spots, dark colored background
     # local scaling if black background
     # scaling for light colors
-    image_hsv = image.convert("HSV")
-    image_hsv_pixels = list(image_hsv.getdata())
+    image_hsv_pixels = np.array(image.convert("HSV"), dtype=np.float32)
 
     scale_factor = desired_brightness / calculate_average_brightness(image)
 
-    scaled_hsv_pixels = []
-    for pixel in image_hsv_pixels:
-        h, s, v = pixel
-        scaled_v = int(v * scale_factor)
-        scaled_hsv_pixels.append((h, s, scaled_v))
+    image_hsv_pixels[..., 2] = np.clip(image_hsv_pixels[..., 2] * scale_factor, 0, 255)
 
-    scaled_image = Image.new("HSV", image.size)
-    scaled_image.putdata(scaled_hsv_pixels)
+    scaled_image = Image.frombytes("HSV", image.size, image_hsv_pixels.astype(np.uint8).tobytes())
 
     return scaled_image.convert("RGB")
 
 def image_to_rgb_array(image):
     """
-    Takes an image, and converts it to a list of RGB values, to be used with ArtNet
+    Takes an image, and converts it to an array of RGB values, to be used with ArtNet
 
     :param image: input image
-    :return: list of lists of RGB values, representing the image
+    :return: (pixels, 3) uint8 array of RGB values, representing the image
+    """
+    return np.asarray(image.convert("RGB"), dtype=np.uint8).reshape(-1, 3)
+
+
+class PaletteImage:
     """
-    pixel_data = list(image.convert("RGB").getdata())
+    Palette-indexed representation of an image.
+        - palette: (colors, 3) uint8 array of RGB values, up to 256 colors
+        - indices: (pixels,) uint8 array with the palette index of each pixel
+
+    Whole-image effects only need to be applied to the palette,
+    the frame is then produced by a single gather of the palette by indices.
+    """
+    def __init__(self, palette: np.ndarray, indices: np.ndarray):
+        self.palette = palette
+        self.indices = indices
+
+    def to_rgb_array(self, palette: np.ndarray = None):
+        """
+        :param palette: palette to use instead of the image's own, e.g. with an effect applied
+        :return: (pixels, 3) uint8 array of RGB values
+        """
+        return np.take(self.palette if palette is None else palette, self.indices, axis=0)
+
+def to_palette_image(pixels: np.ndarray, max_colors: int = 256):
+    """
+    Builds the palette representation of an image.
+
+    Images with up to max_colors unique colors are represented exactly,
+    otherwise they are quantized to max_colors colors.
+
+    :param pixels: (pixels, 3) uint8 array of RGB values
+    :param max_colors: maximum number of colors in the palette [1-256]
+    :return: PaletteImage
+    """
+    palette, indices = np.unique(pixels, axis=0, return_inverse=True)
+
+    if len(palette) > max_colors:
+        quantized = Image.fromarray(np.ascontiguousarray(pixels).reshape(1, -1, 3), "RGB").quantize(max_colors)
+        indices = np.asarray(quantized)
+        palette = np.array(quantized.getpalette()[:3 * (int(indices.max()) + 1)], dtype=np.uint8).reshape(-1, 3)
 
-    output = [list(pixel) for pixel in pixel_data]
-    return output
+    palette.flags.writeable = False
+    return PaletteImage(palette, indices.reshape(-1).astype(np.uint8))
@@ -0,0 +1,128 @@
+"""
+Watchdog of the event loop
+
+Frames are timed on the event loop, so any call blocking it delays every device.
+The watchdog measures the lag of the loop continuously, and reports any callback
+that blocks it for longer than a threshold, with the stack of the blocking call.
+"""
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from confs.global_confs import LOOP_STALL_THRESHOLD, LOOP_LAG_INTERVAL, USE_UVLOOP
+
+
+def install_fast_event_loop() -> str:
+    """
+    Makes new event loops use uvloop, if enabled and installed.
+
+    Must be called before the event loop is created.
+
+    :return: name of the event loop implementation used
+    """
+    if USE_UVLOOP:
+        try:
+            import uvloop
+        except ImportError:
+            print("WARN - uvloop is not installed, using the default asyncio event loop")
+        else:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            return "uvloop"
+
+    return "asyncio"
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = LOOP_STALL_THRESHOLD, interval: float = LOOP_LAG_INTERVAL):
+        """
+        Watches the event loop it is started from.
+
+        A heartbeat task on the loop measures how late it wakes up (the lag of the loop).
+        A thread checks the heartbeat, and if it has not ticked for longer than the threshold,
+        prints the stack of the loop's thread, i.e. the call that is blocking it.
+
+        :param threshold: time the loop may be blocked for before reporting (in seconds)
+        :param interval: interval of the heartbeat (in seconds)
+        """
+        self.threshold = threshold
+        self.interval = interval
+
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.loop_thread_id = None
+        self.heartbeat_task: asyncio.Task | None = None
+        self.thread: threading.Thread | None = None
+        self.stopped = threading.Event()
+
+        # time of the last heartbeat, written by the loop and read by the watchdog thread
+        self.last_beat = time.monotonic()
+
+        # moving average and maximum lag of the loop (in seconds)
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    def start(self):
+        """
+        Starts watching the running event loop. Must be called from the event loop.
+        """
+        if self.heartbeat_task is not None:
+            return
+
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopped.clear()
+
+        self.heartbeat_task = self.loop.create_task(self.__heartbeat())
+        self.thread = threading.Thread(target=self.__watch, name='LoopWatchdog', daemon=True)
+        self.thread.start()
+
+    async def stop(self):
+        if self.heartbeat_task is None:
+            return
+
+        self.stopped.set()
+        self.heartbeat_task.cancel()
+        await asyncio.gather(self.heartbeat_task, return_exceptions=True)
+        await asyncio.to_thread(self.thread.join)
+        self.heartbeat_task = None
+        self.thread = None
+
+    def status(self) -> dict:
+        return {
+            "loop": type(self.loop).__module__.split('.')[0] if self.loop is not None else None,
+            "lag_ms": round(self.lag * 1000, 2),
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+            "stalls": self.stalls
+        }
+
+    async def __heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lag += 0.1 * (lag - self.lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.last_beat = now
+
+    def __watch(self):
+        reported_beat = None
+
+        while not self.stopped.wait(self.threshold / 2):
+            last_beat = self.last_beat
+            blocked = time.monotonic() - last_beat - self.interval
+
+            # report each stall once, while it is still blocking, so the stack shows the culprit
+            if blocked < self.threshold or last_beat == reported_beat:
+                continue
+
+            reported_beat = last_beat
+            self.stalls += 1
+
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else ''
+            print(f"WARN - event loop blocked for {blocked * 1000:.0f}ms, by:\n{stack}")
@@ -0,0 +1,164 @@
+"""
+Network-related utilities
+"""
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t)
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int)
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint)
+    ]
+
+
+def _load_sendmmsg():
+    """
+    :return: libc's sendmmsg function, or None if the platform does not provide it
+    """
+    libc_name = ctypes.util.find_library('c')
+
+    if libc_name is None:
+        return None
+
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        sendmmsg = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+
+    sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    sendmmsg.restype = ctypes.c_int
+    return sendmmsg
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+def _sockaddr(address: tuple[str, int]):
+    # struct sockaddr_in: family (native order), port, address, padding
+    sockaddr = struct.pack('=H', socket.AF_INET) \
+        + struct.pack('!H', address[1]) \
+        + socket.inet_aton(address[0]) \
+        + bytes(8)
+    return ctypes.create_string_buffer(sockaddr, len(sockaddr))
+
+
+class BatchedDatagramSender:
+    """
+    Sends several UDP datagrams to IPv4 destinations.
+
+    On Linux the whole batch is handed to the kernel with one sendmmsg() call,
+    on other platforms it falls back to one sendto() per datagram.
+    """
+    def __init__(self, sock: socket.socket, address: tuple[str, int] | None):
+        """
+        :param sock: UDP socket to send with (must be AF_INET)
+        :param address: tuple of (IP address, port) of the destination of send(),
+            None if datagrams are only sent with send_to()
+        """
+        self.socket = sock
+        self.batched = _sendmmsg is not None and sock.family == socket.AF_INET
+        self.address = None
+        self.__sockaddr = None
+        self.__sockaddrs = {}
+
+        if address is not None:
+            self.set_address(address)
+
+    def set_address(self, address: tuple[str, int]):
+        """
+        Changes the destination of subsequent batches.
+
+        :param address: tuple of (IP address, port) of the destination
+        """
+        self.address = address
+        self.__sockaddr = _sockaddr(address)
+
+    def send(self, datagrams: list[bytes]):
+        """
+        Sends all given datagrams, in order.
+
+        :param datagrams: list of datagram payloads
+        :return: None
+        """
+        if not self.batched:
+            for d in datagrams:
+                self.socket.sendto(d, self.address)
+            return
+
+        sent = 0
+        while sent < len(datagrams):
+            sent += self.__sendmmsg(datagrams[sent:], [self.__sockaddr] * (len(datagrams) - sent))
+
+    def send_to(self, datagrams: list[tuple[bytes, tuple[str, int]]]):
+        """
+        Sends all given datagrams, in order, each to its own destination.
+
+        :param datagrams: list of tuples of (datagram payload, (IP address, port) of the destination)
+        :return: None
+        """
+        if not self.batched:
+            for d, address in datagrams:
+                self.socket.sendto(d, address)
+            return
+
+        # destinations are usually the same from one batch to the next
+        sockaddrs = []
+        for _, address in datagrams:
+            if address not in self.__sockaddrs:
+                self.__sockaddrs[address] = _sockaddr(address)
+            sockaddrs.append(self.__sockaddrs[address])
+
+        payloads = [d for d, _ in datagrams]
+        sent = 0
+        while sent < len(payloads):
+            sent += self.__sendmmsg(payloads[sent:], sockaddrs[sent:])
+
+    def __sendmmsg(self, datagrams: list[bytes], sockaddrs: list) -> int:
+        count = len(datagrams)
+        iovecs = (_IOVec * count)()
+        messages = (_MMsgHdr * count)()
+
+        # keep references to the payloads alive until the call returns
+        buffers = [ctypes.c_char_p(d) for d in datagrams]
+
+        for i, d in enumerate(datagrams):
+            iovecs[i].iov_base = ctypes.cast(buffers[i], ctypes.c_void_p)
+            iovecs[i].iov_len = len(d)
+
+            header = messages[i].msg_hdr
+            header.msg_name = ctypes.cast(sockaddrs[i], ctypes.c_void_p)
+            header.msg_namelen = len(sockaddrs[i])
+            header.msg_iov = ctypes.pointer(iovecs[i])
+            header.msg_iovlen = 1
+
+        result = _sendmmsg(self.socket.fileno(), messages, count, 0)
+
+        if result < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        return result
@@ -0,0 +1,174 @@
+"""
+Warm-start snapshot of the displayed animation
+
+The snapshot is a single binary file:
+    - magic, version and length of the header
+    - JSON header with the track, audio features, scene and array layout
+    - the processed cover, as raw uint8 RGB pixels
+    - one period of brightness factors, as raw float32
+
+Arrays are 8-byte aligned, so they can be used directly from a memory-mapped file.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+
+from utils.common import format_path
+
+SNAPSHOT_PATH = format_path('../confs/snapshot.bin')
+SNAPSHOT_MAGIC = b'SWLEDSNP'
+SNAPSHOT_VERSION = 1
+
+_PREAMBLE = struct.Struct('<8sII')
+
+
+def get_snapshot_path(name: str = None) -> str:
+    """
+    :param name: name of the device the snapshot belongs to, None for the default snapshot
+    :return: path of the snapshot file
+    """
+    if name is None:
+        return SNAPSHOT_PATH
+
+    return format_path(f"../confs/snapshot-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.bin")
+
+
+class Snapshot:
+    def __init__(self,
+                 size: tuple[int, int],
+                 track: dict | None,
+                 audio_features: dict,
+                 scene: str,
+                 cover: np.ndarray,
+                 factors: np.ndarray,
+                 period: float,
+                 running: bool = True):
+        """
+        Snapshot of what a device is displaying.
+
+        :param size: tuple of (width, height) of the device
+        :param track: the displayed track, in the format of the Spotify API (None if idle)
+        :param audio_features: audio features of the displayed track
+        :param scene: name of the displayed scene
+        :param cover: (pixels, 3) uint8 array of the processed cover
+        :param factors: float32 array of brightness factors, sampled over one period of the effect
+        :param period: period of the effect (in seconds)
+        :param running: whether the animation should be resumed on start
+        """
+        self.size = size
+        self.track = track
+        self.audio_features = audio_features
+        self.scene = scene
+        self.cover = cover
+        self.factors = factors
+        self.period = period
+        self.running = running
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def save_snapshot(snapshot: Snapshot, path: str = SNAPSHOT_PATH):
+    """
+    Writes the snapshot. The file is replaced atomically, so a crash never leaves a partial snapshot.
+
+    :param snapshot: the snapshot to save
+    :param path: path of the snapshot file
+    """
+    cover = np.ascontiguousarray(snapshot.cover, dtype=np.uint8)
+    factors = np.ascontiguousarray(snapshot.factors, dtype=np.float32)
+
+    header = {
+        'size': list(snapshot.size),
+        'track': snapshot.track,
+        'audio_features': snapshot.audio_features,
+        'scene': snapshot.scene,
+        'period': snapshot.period,
+        'running': snapshot.running,
+        'cover_shape': list(cover.shape),
+        'factors_count': len(factors)
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    cover_offset = _align(_PREAMBLE.size + len(header_bytes))
+    factors_offset = _align(cover_offset + cover.nbytes)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.seek(cover_offset)
+        f.write(cover.tobytes())
+        f.seek(factors_offset)
+        f.write(factors.tobytes())
+
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Snapshot | None:
+    """
+    Memory-maps the snapshot, and copies its arrays out of the file.
+    The file is not kept open, so it can be replaced or removed while the snapshot is in use.
+
+    :param path: path of the snapshot file
+    :return: the snapshot, or None if there is no valid snapshot
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, header_length = _PREAMBLE.unpack_from(mapped, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return None
+
+        header = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + header_length])
+
+        cover_shape = tuple(header['cover_shape'])
+        cover_offset = _align(_PREAMBLE.size + header_length)
+        cover = np.frombuffer(mapped, dtype=np.uint8, count=int(np.prod(cover_shape)), offset=cover_offset)
+
+        factors_offset = _align(cover_offset + cover.nbytes)
+        factors = np.frombuffer(mapped, dtype=np.float32, count=header['factors_count'], offset=factors_offset)
+
+        cover = cover.copy()
+        factors = factors.copy()
+    except (struct.error, ValueError, KeyError) as e:
+        print(f"WARN - ignoring invalid snapshot {path}: {e}")
+        return None
+    finally:
+        mapped.close()
+
+    # restored arrays are shared like cached covers, so make sure nobody modifies them
+    cover.flags.writeable = False
+    factors.flags.writeable = False
+
+    return Snapshot(
+        tuple(header['size']),
+        header['track'],
+        header['audio_features'],
+        header['scene'],
+        cover.reshape(cover_shape),
+        factors,
+        header['period'],
+        header['running']
+    )
+
+
+def discard_snapshot(path: str = SNAPSHOT_PATH):
+    """
+    Removes the snapshot, if any.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"WARN - could not discard snapshot {path}: {e}")
@@ -0,0 +1,158 @@
+"""
+Lightweight tracing of the stages of a frame
+
+Spans are opt-in (TRACING in confs/global_confs.py, or set_tracing at runtime), and cost a single
+check when disabled. Spans are kept in a ring buffer of the last TRACE_BUFFER_SIZE spans,
+so tracing can stay enabled in production.
+
+The current span is a context variable, so it is carried into asyncio tasks and asyncio.to_thread
+calls: a span opened in a thread records the span it was started from as its parent.
+
+Traces are exported as Chrome trace_event JSON, to be opened in chrome://tracing or https://ui.perfetto.dev
+Each asyncio task and each thread is displayed as its own track.
+
+refer: https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from confs.global_confs import TRACING, TRACE_BUFFER_SIZE
+
+_enabled = TRACING
+_spans = deque(maxlen=TRACE_BUFFER_SIZE)
+_current_span: ContextVar[str | None] = ContextVar('current_span', default=None)
+
+# tracks (asyncio task or thread) -> numeric track ID, as trace viewers expect numeric thread IDs
+# tasks come and go, so tracks without any span left in the buffer are forgotten,
+# whenever the number of tracks doubles (starting from _MAX_TRACKS)
+_MAX_TRACKS = 256
+_tracks: dict[str, int] = {}
+_tracks_lock = threading.Lock()
+_next_track = 1
+_prune_at = _MAX_TRACKS
+
+_origin = time.perf_counter()
+_null_span = nullcontext()
+
+
+def set_tracing(enabled: bool):
+    global _enabled
+    _enabled = enabled
+
+
+def is_tracing() -> bool:
+    return _enabled
+
+
+def clear_trace():
+    global _prune_at
+
+    with _tracks_lock:
+        _spans.clear()
+        _tracks.clear()
+        _prune_at = _MAX_TRACKS
+
+
+def _get_track() -> int:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+
+    name = task.get_name() if task is not None else threading.current_thread().name
+
+    track = _tracks.get(name)
+    if track is None:
+        with _tracks_lock:
+            track = _tracks.get(name)
+            if track is None:
+                track = _add_track(name)
+
+    return track
+
+
+def _add_track(name: str) -> int:
+    global _next_track, _prune_at
+
+    if len(_tracks) >= _prune_at:
+        in_use = {track for _, track, _, _, _ in list(_spans)}
+        for old_name, old_track in list(_tracks.items()):
+            if old_track not in in_use:
+                del _tracks[old_name]
+
+        _prune_at = max(_MAX_TRACKS, 2 * len(_tracks))
+
+    track = _tracks[name] = _next_track
+    _next_track += 1
+    return track
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'start', 'token')
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            self.args['parent'] = parent
+
+        self.token = _current_span.set(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        _current_span.reset(self.token)
+
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+
+        # deque.append is atomic, so spans can be recorded from any thread
+        _spans.append((self.name, _get_track(), self.start, end, self.args))
+        return False
+
+
+def span(name: str, **args):
+    """
+    Context manager timing a stage, if tracing is enabled.
+
+    :param name: name of the stage
+    :param args: additional values to display with the span
+    """
+    if not _enabled:
+        return _null_span
+
+    return _Span(name, args)
+
+
+def export_trace() -> dict:
+    """
+    :return: the recorded spans, in Chrome trace_event JSON format
+    """
+    pid = os.getpid()
+
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": track, "args": {"name": name}}
+        for name, track in list(_tracks.items())
+    ]
+
+    for name, track, start, end, args in list(_spans):
+        events.append({
+            "name": name,
+            "ph": "X",
+            "pid": pid,
+            "tid": track,
+            "ts": (start - _origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "args": args
+        })
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}